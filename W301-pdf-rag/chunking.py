@@ -3,6 +3,7 @@ Text chunking module
 Splits text content into retrievable chunks
 """
 import tiktoken
+from functools import lru_cache
 from typing import List, Dict, Any
 try:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -11,6 +12,12 @@ except ImportError:
 from config import RAGConfig
 
 
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """Return a cached tiktoken encoding"""
+    return tiktoken.get_encoding(encoding_name)
+
+
 def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
     """
     Count the number of tokens in a string
@@ -22,11 +29,30 @@ def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> i
     Returns:
         Number of tokens
     """
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = get_encoding(encoding_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
 
+def truncate_to_tokens(string: str, max_tokens: int, encoding_name: str = "cl100k_base") -> str:
+    """
+    Truncate a string to at most max_tokens tokens
+    
+    Args:
+        string: Text to truncate
+        max_tokens: Maximum number of tokens to keep
+        encoding_name: Tokenizer encoding name
+        
+    Returns:
+        Truncated text (unchanged if already within budget)
+    """
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode(string)
+    if len(tokens) <= max_tokens:
+        return string
+    return encoding.decode(tokens[:max_tokens])
+
+
 def chunk_text(text: str, chunk_size: int = None, chunk_overlap: int = None) -> List[str]:
     """
     Split text into chunks using recursive character splitting
@@ -57,6 +57,32 @@ def ollama_embedding(inputs: List[str], model: str = "nomic-embed-text") -> List
     """
     import os
     ollama_url = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+    
+    # /api/embed takes the whole batch in one request (Ollama >= 0.3.4)
+    retry = 0
+    max_retries = 3
+    
+    while retry < max_retries:
+        try:
+            response = requests.post(
+                f'{ollama_url}/api/embed',
+                json={"model": model, "input": inputs},
+                timeout=60
+            )
+            if response.status_code == 404 and 'model' not in response.text:
+                # Older Ollama without the batch endpoint
+                break
+            response.raise_for_status()
+            return response.json()['embeddings']
+        except Exception as e:
+            retry += 1
+            if retry < max_retries:
+                print(f"Ollama embedding failed (attempt {retry}/{max_retries}): {e}")
+                time.sleep(1)
+            else:
+                raise Exception(f"Failed to get Ollama embeddings after {max_retries} attempts: {e}")
+    
+    # Fall back to the legacy one-text-per-request endpoint
     all_embeddings = []
     
     for text in inputs:
@@ -122,7 +148,7 @@ def openai_embedding(inputs: List[str], model: str = "text-embedding-3-large") -
                 raise Exception(f"Failed to get OpenAI embeddings after {max_retries} attempts: {e}")
 
 
-def batch_embed(texts: List[str], batch_size: int = 25, use_openai: bool = False, use_ollama: bool = None) -> List[List[float]]:
+def batch_embed(texts: List[str], batch_size: int = 64, use_openai: bool = False, use_ollama: bool = None) -> List[List[float]]:
     """
     Embed texts in batches for efficiency
     
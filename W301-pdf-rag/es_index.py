@@ -2,8 +2,8 @@
 Elasticsearch index management module
 Handles index creation, deletion, and document indexing
 """
-from config import get_es, ModelConfig, RAGConfig
-from typing import Dict, List, Any
+from config import get_es, ElasticConfig, ModelConfig, RAGConfig
+from typing import Dict, Any, Iterable
 import time
 
 
@@ -55,6 +55,9 @@ def create_index(index_name: str, include_metadata: bool = True) -> bool:
             "file_path": {
                 "type": "keyword"
             },
+            "file_hash": {
+                "type": "keyword"
+            },
             "chunk_id": {
                 "type": "keyword"
             },
@@ -144,45 +147,102 @@ def index_document(index_name: str, document: Dict[str, Any], doc_id: str = None
                 return False
 
 
-def bulk_index_documents(index_name: str, documents: List[Dict[str, Any]]) -> int:
+def bulk_index_documents(index_name: str, documents: Iterable[Dict[str, Any]], chunk_size: int = 500) -> int:
     """
     Bulk index multiple documents in Elasticsearch
     
+    Documents are consumed lazily and sent in chunks, so a generator can be
+    passed to avoid holding every vector in memory at once.
+    
     Args:
         index_name: Name of the index
-        documents: List of documents to index
+        documents: Iterable of documents to index
+        chunk_size: Number of documents per bulk request
         
     Returns:
         Number of successfully indexed documents
     """
     es = get_es()
     success_count = 0
+    failed_count = 0
     
     # Prepare bulk operations
-    from elasticsearch.helpers import bulk
+    from elasticsearch.helpers import streaming_bulk
     
-    actions = []
-    for doc in documents:
-        action = {
-            "_index": index_name,
-            "_source": doc
-        }
-        if "doc_id" in doc:
-            action["_id"] = doc.pop("doc_id")
-        actions.append(action)
+    def actions():
+        for doc in documents:
+            action = {
+                "_index": index_name,
+                "_source": doc
+            }
+            if "doc_id" in doc:
+                action["_id"] = doc.pop("doc_id")
+            yield action
     
     try:
-        success, failed = bulk(es, actions, raise_on_error=False)
-        success_count = success
-        if failed:
-            print(f"[Warning] {len(failed)} documents failed to index")
+        bulk_client = es.options(request_timeout=ElasticConfig.bulk_request_timeout)
+        for ok, _ in streaming_bulk(bulk_client, actions(), chunk_size=chunk_size,
+                                    max_chunk_bytes=ElasticConfig.bulk_max_chunk_bytes,
+                                    raise_on_error=False):
+            if ok:
+                success_count += 1
+            else:
+                failed_count += 1
+        if failed_count:
+            print(f"[Warning] {failed_count} documents failed to index")
     except Exception as e:
         print(f"[Error] Bulk indexing failed: {e}")
     
-    print(f"[Success] Indexed {success_count}/{len(documents)} documents")
+    print(f"[Success] Indexed {success_count}/{success_count + failed_count} documents")
     return success_count
 
 
+def count_documents(index_name: str, query: Dict[str, Any] = None) -> int:
+    """
+    Count documents in an index, optionally filtered by a query
+    
+    Args:
+        index_name: Name of the index
+        query: Optional Elasticsearch query to filter by
+        
+    Returns:
+        Number of matching documents (0 if the index does not exist)
+    """
+    es = get_es()
+    try:
+        if not es.indices.exists(index=index_name):
+            return 0
+        if query is None:
+            return es.count(index=index_name)['count']
+        return es.count(index=index_name, query=query)['count']
+    except Exception as e:
+        print(f"[Error] Failed to count documents in '{index_name}': {e}")
+        return 0
+
+
+def delete_documents(index_name: str, query: Dict[str, Any]) -> int:
+    """
+    Delete every document matching a query
+    
+    Args:
+        index_name: Name of the index
+        query: Elasticsearch query selecting the documents to delete
+        
+    Returns:
+        Number of deleted documents (0 if the index does not exist)
+    """
+    es = get_es()
+    try:
+        if not es.indices.exists(index=index_name):
+            return 0
+        response = es.delete_by_query(index=index_name, query=query,
+                                      conflicts="proceed", refresh=True)
+        return response.get('deleted', 0)
+    except Exception as e:
+        print(f"[Error] Failed to delete documents from '{index_name}': {e}")
+        return 0
+
+
 def get_index_stats(index_name: str) -> Dict[str, Any]:
     """
     Get statistics about an index
@@ -3,15 +3,20 @@ PDF processing module
 Extracts text, images, and tables from PDF documents
 """
 import os
+import asyncio
 import fitz  # PyMuPDF
 import base64
 import mimetypes
 import time
 import logging
-from typing import List, Dict, Any, Tuple
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Set
 from pathlib import Path
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from config import ModelConfig, RAGConfig
+from chunking import truncate_to_tokens
 
 
 logging.basicConfig(level=logging.INFO)
@@ -47,6 +52,93 @@ def extract_text_from_pdf(pdf_path: str) -> List[Dict[str, Any]]:
     return text_content
 
 
+def find_boilerplate_lines(pages: List[Dict[str, Any]], min_ratio: float = None) -> Set[str]:
+    """
+    Find header/footer lines that repeat across most pages
+    
+    Args:
+        pages: Page dictionaries as returned by extract_text_from_pdf
+        min_ratio: Share of pages a line must appear on (defaults to RAGConfig.BOILERPLATE_LINE_RATIO)
+        
+    Returns:
+        Set of stripped lines considered boilerplate
+    """
+    if min_ratio is None:
+        min_ratio = RAGConfig.BOILERPLATE_LINE_RATIO
+    
+    # Too few pages to tell boilerplate apart from content
+    if len(pages) < 3:
+        return set()
+    
+    counts = Counter()
+    for page in pages:
+        counts.update({line.strip() for line in page.get('text', '').splitlines() if line.strip()})
+    
+    return {line for line, count in counts.items() if count / len(pages) > min_ratio}
+
+
+def strip_boilerplate(text: str, boilerplate_lines: Set[str] = None) -> str:
+    """
+    Remove header/footer lines from page text
+    
+    Args:
+        text: Page text
+        boilerplate_lines: Lines to remove (see find_boilerplate_lines)
+        
+    Returns:
+        Text without boilerplate lines
+    """
+    if not boilerplate_lines:
+        return text
+    return "\n".join(line for line in text.splitlines() if line.strip() not in boilerplate_lines)
+
+
+IMAGE_SUMMARY_PROMPT = """详细地描述这张图片的内容，不要漏掉细节，并提取图片中的文字。注意只需客观说明图片内容，无需进行任何评价。"""
+
+IMAGE_CONTEXT_SYSTEM_PROMPT = "你是一个智能AI助手，根据图片的上下文对图片描述进行补充，补充后的描述要更加准确，更加详细，更加完整。"
+
+
+def _image_data_url(content_bytes: bytes, mime_type: str) -> str:
+    """Encode raw image bytes as a Base64 data URL"""
+    encoded = base64.b64encode(content_bytes).decode('utf-8')
+    return f"data:{mime_type};base64,{encoded}"
+
+
+def _image_summary_messages(data_url: str) -> List[Dict[str, Any]]:
+    """Build the vision model request messages for an image"""
+    return [{
+        'role': 'user',
+        'content': [
+            {'type': 'text', 'text': IMAGE_SUMMARY_PROMPT}, 
+            {'type': 'image_url', 'image_url': {'url': data_url}}
+        ]
+    }]
+
+
+def _image_context_prompt(page_context: str, image_description: str) -> str:
+    """Build the context augmentation prompt for an image description"""
+    return f'''目标：通过图片的上下文以及来源文件信息补充图片描述的细节，准确描述出图片在文档中的实际内容和用途含义。
+
+注意事项：
+- 上下文中可能会有噪音，请注意甄别。
+- 重点关注上下文中的图片caption标注，因为它们通常描述图片的用途和意义。
+- 保留图片的意图与重要信息,过滤掉与上下文无关的信息。
+- 有时图片描述中会出现重复性的内容，这类内容请视为噪音过滤掉。
+- 请直接输出答案，无需解释。
+- 如果图片不包含任何内容，或者为背景图片，输出 0
+
+图片描述：
+```
+{image_description}
+```
+
+上下文：
+```
+{truncate_to_tokens(page_context, RAGConfig.AUGMENT_CONTEXT_TOKENS)}
+```
+'''
+
+
 def summarize_image(image_path: str, base_url: str = ModelConfig.IMAGE_MODEL_URL) -> str:
     """
     Generate a detailed description of an image using a vision model
@@ -61,8 +153,6 @@ def summarize_image(image_path: str, base_url: str = ModelConfig.IMAGE_MODEL_URL
     retry = 0
     max_retries = 3
     
-    prompt = """详细地描述这张图片的内容，不要漏掉细节，并提取图片中的文字。注意只需客观说明图片内容，无需进行任何评价。"""
-    
     while retry < max_retries:
         try:
             client = OpenAI(api_key='YOUR_API_KEY', base_url=base_url)
@@ -71,18 +161,11 @@ def summarize_image(image_path: str, base_url: str = ModelConfig.IMAGE_MODEL_URL
             with open(image_path, 'rb') as f:
                 content_bytes = f.read()
             mime_type = mimetypes.guess_type(image_path)[0] or 'image/png'
-            encoded = base64.b64encode(content_bytes).decode('utf-8')
-            data_url = f"data:{mime_type};base64,{encoded}"
+            data_url = _image_data_url(content_bytes, mime_type)
             
             resp = client.chat.completions.create(
                 model='internvl-internlm2',
-                messages=[{
-                    'role': 'user',
-                    'content': [
-                        {'type': 'text', 'text': prompt}, 
-                        {'type': 'image_url', 'image_url': {'url': data_url}}
-                    ]
-                }], 
+                messages=_image_summary_messages(data_url), 
                 temperature=0.8, 
                 top_p=0.8, 
                 max_tokens=2048, 
@@ -100,6 +183,47 @@ def summarize_image(image_path: str, base_url: str = ModelConfig.IMAGE_MODEL_URL
                 return ""
 
 
+async def summarize_image_async(image_bytes: bytes, mime_type: str = 'image/png',
+                                base_url: str = ModelConfig.IMAGE_MODEL_URL) -> str:
+    """
+    Async version of summarize_image that works on in-memory image bytes
+    
+    Args:
+        image_bytes: Encoded image content
+        mime_type: MIME type of the encoded image
+        base_url: Base URL for the vision model API
+        
+    Returns:
+        Image description text
+    """
+    retry = 0
+    max_retries = 3
+    data_url = _image_data_url(image_bytes, mime_type)
+    
+    while retry < max_retries:
+        try:
+            client = AsyncOpenAI(api_key='YOUR_API_KEY', base_url=base_url)
+            
+            resp = await client.chat.completions.create(
+                model='internvl-internlm2',
+                messages=_image_summary_messages(data_url), 
+                temperature=0.8, 
+                top_p=0.8, 
+                max_tokens=2048, 
+                stream=False
+            )
+            
+            return resp.choices[0].message.content
+        except Exception as e:
+            retry += 1
+            if retry < max_retries:
+                logger.warning(f"Image summarization failed (attempt {retry}/{max_retries}): {e}")
+                await asyncio.sleep(1)
+            else:
+                logger.error(f"Failed to summarize image after {max_retries} attempts: {e}")
+                return ""
+
+
 def context_augment_image(page_context: str, image_description: str) -> str:
     """
     Augment image description with page context using LLM
@@ -111,26 +235,7 @@ def context_augment_image(page_context: str, image_description: str) -> str:
     Returns:
         Context-augmented image description
     """
-    prompt = f'''目标：通过图片的上下文以及来源文件信息补充图片描述的细节，准确描述出图片在文档中的实际内容和用途含义。
-
-注意事项：
-- 上下文中可能会有噪音，请注意甄别。
-- 重点关注上下文中的图片caption标注，因为它们通常描述图片的用途和意义。
-- 保留图片的意图与重要信息,过滤掉与上下文无关的信息。
-- 有时图片描述中会出现重复性的内容，这类内容请视为噪音过滤掉。
-- 请直接输出答案，无需解释。
-- 如果图片不包含任何内容，或者为背景图片，输出 0
-
-图片描述：
-```
-{image_description}
-```
-
-上下文：
-```
-{page_context[:2000]}
-```
-'''
+    prompt = _image_context_prompt(page_context, image_description)
     
     try:
         client = OpenAI(
@@ -140,7 +245,7 @@ def context_augment_image(page_context: str, image_description: str) -> str:
         response = client.chat.completions.create(
             model=ModelConfig.LLM_MODEL,
             messages=[
-                {"role": "system", "content": "你是一个智能AI助手，根据图片的上下文对图片描述进行补充，补充后的描述要更加准确，更加详细，更加完整。"},
+                {"role": "system", "content": IMAGE_CONTEXT_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ]
         )
@@ -155,13 +260,210 @@ def context_augment_image(page_context: str, image_description: str) -> str:
         return image_description
 
 
-def extract_images_from_pdf(pdf_path: str, output_dir: str = None) -> List[Dict[str, Any]]:
+async def context_augment_image_async(page_context: str, image_description: str) -> str:
+    """
+    Async version of context_augment_image
+    
+    Args:
+        page_context: Text context from the page
+        image_description: Initial image description
+        
+    Returns:
+        Context-augmented image description
+    """
+    prompt = _image_context_prompt(page_context, image_description)
+    
+    try:
+        client = AsyncOpenAI(
+            api_key=ModelConfig.OPENAI_API_KEY,
+            base_url=ModelConfig.OPENAI_BASE_URL
+        )
+        response = await client.chat.completions.create(
+            model=ModelConfig.LLM_MODEL,
+            messages=[
+                {"role": "system", "content": IMAGE_CONTEXT_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+        )
+        result = response.choices[0].message.content
+        
+        # Filter out background images
+        if result.strip() == "0":
+            return ""
+        return result
+    except Exception as e:
+        logger.error(f"Context augmentation failed: {e}")
+        return image_description
+
+
+def _render_image(pdf_document: fitz.Document, xref: int) -> Tuple[bytes, str, str]:
+    """
+    Render an embedded image to encoded bytes suitable for the vision model
+    
+    Args:
+        pdf_document: Open PDF document
+        xref: Cross-reference number of the image
+        
+    Returns:
+        Tuple of (image_bytes, mime_type, file_extension)
+    """
+    pix = fitz.Pixmap(pdf_document, xref)
+    if pix.colorspace and pix.colorspace.name == 'DeviceCMYK':
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    
+    # Vision models downscale large inputs anyway, so don't upload full resolution
+    longest_side = max(pix.width, pix.height)
+    if longest_side > RAGConfig.MAX_IMAGE_DIM:
+        scale = RAGConfig.MAX_IMAGE_DIM / longest_side
+        pix = fitz.Pixmap(pix, int(pix.width * scale), int(pix.height * scale), None)
+    
+    # Use PNG only when transparency matters, JPEG is much smaller otherwise
+    if pix.alpha:
+        return pix.tobytes("png"), 'image/png', 'png'
+    return pix.tobytes("jpeg", jpg_quality=RAGConfig.JPEG_QUALITY), 'image/jpeg', 'jpg'
+
+
+async def _produce_images(pdf_document: fitz.Document, page_to_images: List[List[tuple]],
+                          output_dir: str, queue: asyncio.Queue, num_workers: int,
+                          boilerplate_lines: Set[str] = None) -> None:
+    """
+    Render qualifying images page by page and feed them to the worker queue
+    
+    Args:
+        pdf_document: Open PDF document
+        page_to_images: Image listing for every page
+        output_dir: Directory used to name extracted images
+        queue: Bounded queue shared with the workers
+        num_workers: Number of workers to send a stop sentinel to
+        boilerplate_lines: Header/footer lines left out of the augmentation context
+    """
+    processed_xrefs = set()
+    
+    try:
+        for page_num in range(pdf_document.page_count):
+            try:
+                page = pdf_document.load_page(page_num)
+                page_width = page.rect.width
+                
+                # Extract page text as context
+                page_text = page.get_text("text")
+                
+                for img_index, item in enumerate(page_to_images[page_num]):
+                    try:
+                        xref = item[0]
+                        if xref in processed_xrefs:
+                            continue
+                        processed_xrefs.add(xref)
+                        
+                        image_width = item[2]
+                        image_height = item[3]
+                        
+                        # Filter small images
+                        if (image_width < page_width / RAGConfig.IMAGE_WIDTH_RATIO or 
+                            image_width < RAGConfig.MIN_IMAGE_WIDTH or 
+                            image_height < RAGConfig.MIN_IMAGE_HEIGHT):
+                            continue
+                        
+                        # Extract image off the event loop so workers keep making API calls
+                        image_bytes, mime_type, ext = await asyncio.to_thread(_render_image, pdf_document, xref)
+                        
+                        await queue.put({
+                            "image_bytes": image_bytes,
+                            "mime_type": mime_type,
+                            "page_num": page_num + 1,
+                            "image_index": img_index + 1,
+                            "image_path": f'{output_dir}/img_{page_num + 1}_{img_index + 1}.{ext}',
+                            "page_context": page_text,
+                            "augment_context": strip_boilerplate(page_text, boilerplate_lines)
+                        })
+                    except Exception as e:
+                        logger.error(f"Error processing image on page {page_num + 1}: {e}")
+                        
+            except Exception as e:
+                logger.error(f"Error processing page {page_num + 1}: {e}")
+    finally:
+        for _ in range(num_workers):
+            await queue.put(None)
+
+
+async def _consume_images(queue: asyncio.Queue, results: List[Dict[str, Any]]) -> None:
+    """
+    Caption and context-augment images from the queue until a stop sentinel arrives
+    
+    Args:
+        queue: Bounded queue shared with the producer
+        results: Shared list that processed images are appended to
+    """
+    while True:
+        job = await queue.get()
+        if job is None:
+            break
+        
+        try:
+            # Generate image description
+            summary = await summarize_image_async(job["image_bytes"], job["mime_type"])
+            if not summary:
+                continue
+            
+            # Augment with context
+            augmented_summary = await context_augment_image_async(job["augment_context"], summary)
+            if not augmented_summary:
+                continue
+            
+            results.append({
+                "page_num": job["page_num"],
+                "image_index": job["image_index"],
+                "summary": summary,
+                "context_augmented_summary": augmented_summary,
+                "image_path": job["image_path"],
+                "page_context": job["page_context"].strip(),
+                "type": "image"
+            })
+            
+            logger.info(f"Processed image {len(results)} on page {job['page_num']}")
+        except Exception as e:
+            logger.error(f"Error processing image on page {job['page_num']}: {e}")
+
+
+async def _extract_images_async(pdf_document: fitz.Document, page_to_images: List[List[tuple]],
+                                output_dir: str, boilerplate_lines: Set[str] = None) -> List[Dict[str, Any]]:
+    """
+    Run image extraction and captioning as a bounded producer/consumer pipeline
+    
+    Args:
+        pdf_document: Open PDF document
+        page_to_images: Image listing for every page
+        output_dir: Directory used to name extracted images
+        boilerplate_lines: Header/footer lines left out of the augmentation context
+        
+    Returns:
+        List of dictionaries containing image information, in page order
+    """
+    queue = asyncio.Queue(maxsize=RAGConfig.IMAGE_QUEUE_SIZE)
+    num_workers = RAGConfig.IMAGE_WORKERS
+    results = []
+    
+    await asyncio.gather(
+        _produce_images(pdf_document, page_to_images, output_dir, queue, num_workers, boilerplate_lines),
+        *[_consume_images(queue, results) for _ in range(num_workers)]
+    )
+    
+    results.sort(key=lambda r: (r["page_num"], r["image_index"]))
+    return results
+
+
+def extract_images_from_pdf(pdf_path: str, output_dir: str = None,
+                            boilerplate_lines: Set[str] = None) -> List[Dict[str, Any]]:
     """
     Extract images from PDF and generate descriptions
     
+    Images are rendered by a single producer and captioned concurrently by
+    RAGConfig.IMAGE_WORKERS workers, so PDF decoding overlaps with API calls.
+    
     Args:
         pdf_path: Path to PDF file
-        output_dir: Directory to save extracted images (temporary)
+        output_dir: Directory used to name extracted images
+        boilerplate_lines: Header/footer lines left out of the augmentation context
         
     Returns:
         List of dictionaries containing image information
@@ -169,18 +471,12 @@ def extract_images_from_pdf(pdf_path: str, output_dir: str = None) -> List[Dict[
     if output_dir is None:
         output_dir = RAGConfig.IMAGE_DIR
     
-    os.makedirs(output_dir, exist_ok=True)
-    
     pdf_document = fitz.open(pdf_path)
     logger.info(f"Processing PDF: {pdf_path}")
     
-    # Get unique images
-    unique_xrefs = set()
-    for p in range(pdf_document.page_count):
-        page_images = pdf_document.get_page_images(p)
-        for item in page_images:
-            xref = item[0]
-            unique_xrefs.add(xref)
+    # Enumerate page images once and reuse the listing in the main loop
+    page_to_images = [pdf_document.get_page_images(p) for p in range(pdf_document.page_count)]
+    unique_xrefs = {item[0] for page_images in page_to_images for item in page_images}
     
     logger.info(f"Found {len(unique_xrefs)} unique images")
     
@@ -188,80 +484,11 @@ def extract_images_from_pdf(pdf_path: str, output_dir: str = None) -> List[Dict[
         pdf_document.close()
         return []
     
-    results = []
-    processed_xrefs = set()
-    
-    for page_num in range(pdf_document.page_count):
-        try:
-            page = pdf_document.load_page(page_num)
-            page_width = page.rect.width
-            
-            # Extract page text as context
-            page_text = page.get_text("text")
-            
-            page_images = pdf_document.get_page_images(page_num)
-            for img_index, item in enumerate(page_images):
-                try:
-                    xref = item[0]
-                    if xref in processed_xrefs:
-                        continue
-                    processed_xrefs.add(xref)
-                    
-                    image_width = item[2]
-                    image_height = item[3]
-                    
-                    # Filter small images
-                    if (image_width < page_width / RAGConfig.IMAGE_WIDTH_RATIO or 
-                        image_width < RAGConfig.MIN_IMAGE_WIDTH or 
-                        image_height < RAGConfig.MIN_IMAGE_HEIGHT):
-                        continue
-                    
-                    # Extract image
-                    pix = fitz.Pixmap(pdf_document, xref)
-                    if pix.colorspace and pix.colorspace.name == 'DeviceCMYK':
-                        pix = fitz.Pixmap(fitz.csRGB, pix)
-                    
-                    image_save_path = f'{output_dir}/img_{page_num + 1}_{img_index + 1}.png'
-                    pix.save(image_save_path)
-                    del pix
-                    
-                    # Generate image description
-                    summary = summarize_image(image_save_path)
-                    if not summary:
-                        os.remove(image_save_path)
-                        continue
-                    
-                    # Augment with context
-                    augmented_summary = context_augment_image(page_text, summary)
-                    if not augmented_summary:
-                        os.remove(image_save_path)
-                        continue
-                    
-                    results.append({
-                        "page_num": page_num + 1,
-                        "image_index": img_index + 1,
-                        "summary": summary,
-                        "context_augmented_summary": augmented_summary,
-                        "image_path": image_save_path,
-                        "page_context": page_text.strip(),
-                        "type": "image"
-                    })
-                    
-                    logger.info(f"Processed image {len(results)} on page {page_num + 1}")
-                    
-                    # Clean up temporary image
-                    try:
-                        os.remove(image_save_path)
-                    except:
-                        pass
-                        
-                except Exception as e:
-                    logger.error(f"Error processing image on page {page_num + 1}: {e}")
-                    
-        except Exception as e:
-            logger.error(f"Error processing page {page_num + 1}: {e}")
+    try:
+        results = asyncio.run(_extract_images_async(pdf_document, page_to_images, output_dir, boilerplate_lines))
+    finally:
+        pdf_document.close()
     
-    pdf_document.close()
     logger.info(f"Extracted {len(results)} images")
     return results
 
@@ -290,7 +517,7 @@ def table_context_augment(page_context: str, table_md: str) -> str:
 {table_md}
 
 表格上下文：
-{page_context[:1500]}
+{truncate_to_tokens(page_context, RAGConfig.AUGMENT_CONTEXT_TOKENS)}
 """
     
     try:
@@ -311,51 +538,90 @@ def table_context_augment(page_context: str, table_md: str) -> str:
         return table_md
 
 
-def extract_tables_from_pdf(pdf_path: str) -> List[Dict[str, Any]]:
+def _extract_page_tables(pdf_document: fitz.Document, doc_lock: threading.Lock,
+                         page_num: int, boilerplate_lines: Set[str] = None) -> List[Dict[str, Any]]:
     """
-    Extract tables from PDF and generate summaries
+    Extract and summarize the tables on a single page
     
     Args:
-        pdf_path: Path to PDF file
+        pdf_document: Open PDF document shared between threads
+        doc_lock: Lock guarding access to pdf_document
+        page_num: Zero-based page number
+        boilerplate_lines: Header/footer lines left out of the augmentation context
         
     Returns:
-        List of dictionaries containing table information
+        List of dictionaries containing table information for the page
     """
-    pdf_document = fitz.open(pdf_path)
     results = []
     
-    for page_num in range(pdf_document.page_count):
-        try:
+    # fitz is not thread-safe on a shared document, only the LLM calls run unlocked
+    try:
+        with doc_lock:
             page = pdf_document.load_page(page_num)
             page_text = page.get_text("text")
-            page_tables = page.find_tables()
-            
-            for table_index, table in enumerate(page_tables):
+            page_tables = []
+            for table_index, table in enumerate(page.find_tables()):
                 try:
-                    md = table.to_markdown()
-                    if not md.strip():
-                        continue
-                    
-                    # Generate table summary
-                    augmented = table_context_augment(page_text, md)
-                    
-                    results.append({
-                        "page_num": page_num + 1,
-                        "table_index": table_index + 1,
-                        "table_markdown": md,
-                        "page_context": page_text.strip(),
-                        "context_augmented_table": augmented,
-                        "type": "table"
-                    })
-                    
-                    logger.info(f"Processed table {table_index + 1} on page {page_num + 1}")
+                    page_tables.append((table_index, table.to_markdown()))
                 except Exception as e:
                     logger.error(f"Error processing table on page {page_num + 1}: {e}")
-                    
+    except Exception as e:
+        logger.error(f"Error processing page {page_num + 1}: {e}")
+        return results
+    
+    for table_index, md in page_tables:
+        try:
+            if not md.strip():
+                continue
+            
+            # Generate table summary
+            augmented = table_context_augment(strip_boilerplate(page_text, boilerplate_lines), md)
+            
+            results.append({
+                "page_num": page_num + 1,
+                "table_index": table_index + 1,
+                "table_markdown": md,
+                "page_context": page_text.strip(),
+                "context_augmented_table": augmented,
+                "type": "table"
+            })
+            
+            logger.info(f"Processed table {table_index + 1} on page {page_num + 1}")
         except Exception as e:
-            logger.error(f"Error processing page {page_num + 1}: {e}")
+            logger.error(f"Error processing table on page {page_num + 1}: {e}")
+    
+    return results
+
+
+def extract_tables_from_pdf(pdf_path: str, boilerplate_lines: Set[str] = None) -> List[Dict[str, Any]]:
+    """
+    Extract tables from PDF and generate summaries
+    
+    Pages are handled by a thread pool so table summarization calls for
+    different pages overlap; access to the document itself is serialized.
+    
+    Args:
+        pdf_path: Path to PDF file
+        boilerplate_lines: Header/footer lines left out of the augmentation context
+        
+    Returns:
+        List of dictionaries containing table information
+    """
+    pdf_document = fitz.open(pdf_path)
+    doc_lock = threading.Lock()
+    results = []
+    
+    try:
+        with ThreadPoolExecutor(max_workers=RAGConfig.TABLE_WORKERS) as executor:
+            page_results = executor.map(
+                lambda page_num: _extract_page_tables(pdf_document, doc_lock, page_num, boilerplate_lines),
+                range(pdf_document.page_count)
+            )
+            for page_tables in page_results:
+                results.extend(page_tables)
+    finally:
+        pdf_document.close()
     
-    pdf_document.close()
     logger.info(f"Extracted {len(results)} tables")
     return results
 
@@ -383,17 +649,20 @@ def process_pdf(pdf_path: str, process_images: bool = None, process_tables: bool
     # Always extract text
     text_content = extract_text_from_pdf(pdf_path)
     
+    # Headers/footers only add noise to augmentation prompts, detect them once per document
+    boilerplate_lines = find_boilerplate_lines(text_content) if (process_images or process_tables) else set()
+    
     # Conditionally extract images and tables
     if process_images:
         logger.info("Extracting images (this may take a while)...")
-        images = extract_images_from_pdf(pdf_path)
+        images = extract_images_from_pdf(pdf_path, boilerplate_lines=boilerplate_lines)
     else:
         logger.info("Skipping image extraction (set process_images=True to enable)")
         images = []
     
     if process_tables:
         logger.info("Extracting tables (this may take a while)...")
-        tables = extract_tables_from_pdf(pdf_path)
+        tables = extract_tables_from_pdf(pdf_path, boilerplate_lines=boilerplate_lines)
     else:
         logger.info("Skipping table extraction (set process_tables=True to enable)")
         tables = []
@@ -3,6 +3,9 @@ Main RAG pipeline orchestrator
 Coordinates the entire PDF RAG workflow
 """
 import os
+import json
+import asyncio
+import hashlib
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
@@ -10,13 +13,50 @@ from config import RAGConfig
 from pdf_processor import process_pdf
 from chunking import prepare_all_chunks
 from embedding import batch_embed
-from es_index import create_index, bulk_index_documents, get_index_stats
-from retrieval import hybrid_search
+from es_index import create_index, bulk_index_documents, get_index_stats, count_documents, delete_documents
+from retrieval import hybrid_search, hybrid_search_many
 from reranking import rerank_documents
-from query_enhancement import rag_fusion, query_decomposition, coreference_resolution
+from query_enhancement import (rag_fusion, query_decomposition, coreference_resolution,
+                               enhance_and_retrieve, enhance_query, retrieve_sub_queries)
 from answer_generation import generate_answer, generate_multi_query_answer, generate_decomposed_answer
 
 
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 digest of a file without reading it into memory at once
+    
+    Args:
+        path: Path to the file
+        block_size: Number of bytes to read per step
+        
+    Returns:
+        Hex digest of the file content
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _load_ingest_cache() -> Dict[str, Dict[str, Any]]:
+    """Load the ingestion cache sidecar file (empty if missing or unreadable)"""
+    try:
+        with open(RAGConfig.INGEST_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_ingest_cache(cache: Dict[str, Dict[str, Any]]) -> None:
+    """Persist the ingestion cache sidecar file"""
+    try:
+        with open(RAGConfig.INGEST_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"[Warning] Could not write ingest cache: {e}")
+
+
 class PDFRAGPipeline:
     """Complete PDF RAG pipeline"""
     
@@ -32,7 +72,8 @@ class PDFRAGPipeline:
         self.use_openai_embedding = use_openai_embedding
     
     def ingest_pdf(self, pdf_path: str, file_name: str = None, 
-                   process_images: bool = None, process_tables: bool = None) -> Dict[str, Any]:
+                   process_images: bool = None, process_tables: bool = None,
+                   force_reingest: bool = False) -> Dict[str, Any]:
         """
         Ingest a PDF document into the RAG system
         
@@ -43,6 +84,7 @@ class PDFRAGPipeline:
                           Set to True for documents with important diagrams/figures
             process_tables: Whether to extract tables (defaults to RAGConfig.PROCESS_TABLES)
                           Set to True for documents with important structured data
+            force_reingest: Re-run the full pipeline even if this exact file is already indexed
             
         Returns:
             Dictionary with ingestion statistics
@@ -50,6 +92,8 @@ class PDFRAGPipeline:
         Note:
             By default, images and tables are skipped for faster processing.
             Enable them for comprehensive document understanding (5-10x slower).
+            A file whose content hash is already indexed with the same options
+            is skipped and its previous statistics are returned.
         """
         print(f"\n{'='*60}")
         print(f"Starting PDF ingestion: {pdf_path}")
@@ -57,6 +101,23 @@ class PDFRAGPipeline:
         
         if file_name is None:
             file_name = Path(pdf_path).name
+        if process_images is None:
+            process_images = RAGConfig.PROCESS_IMAGES
+        if process_tables is None:
+            process_tables = RAGConfig.PROCESS_TABLES
+        
+        # Skip unchanged files that are still present in the index
+        file_hash = file_sha256(pdf_path)
+        ingest_cache = _load_ingest_cache()
+        cached = ingest_cache.get(self.index_name, {}).get(file_hash)
+        if (not force_reingest and cached
+                and cached.get('process_images') == process_images
+                and cached.get('process_tables') == process_tables
+                and count_documents(self.index_name, {'term': {'file_hash': file_hash}}) > 0):
+            print(f"[Info] {file_name} is unchanged and already indexed, skipping "
+                  f"(use force_reingest=True to rebuild)")
+            # Same content may arrive under a new name; report the current one
+            return {**cached['result'], 'file_name': file_name, 'skipped': True}
         
         # Step 1: Extract content from PDF
         print("Step 1: Extracting content from PDF...")
@@ -76,22 +137,25 @@ class PDFRAGPipeline:
         # Step 3: Generate embeddings
         print("\nStep 3: Generating embeddings...")
         texts = [chunk['text'] for chunk in chunks]
-        embeddings = batch_embed(texts, batch_size=25, use_openai=self.use_openai_embedding)
+        embeddings = batch_embed(texts, batch_size=64, use_openai=self.use_openai_embedding)
         
-        # Step 4: Prepare documents for indexing
+        # Step 4: Prepare documents for indexing (built lazily while bulk indexing)
         print("\nStep 4: Preparing documents for indexing...")
-        documents = []
-        for chunk, embedding in zip(chunks, embeddings):
-            doc = {
-                'text': chunk['text'],
-                'vector': embedding,
-                'doc_type': chunk.get('doc_type', 'text'),
-                'page_num': chunk.get('page_num', 0),
-                'file_name': file_name,
-                'file_path': pdf_path,
-                'metadata': chunk
-            }
-            documents.append(doc)
+        # Deterministic ids: re-indexing the same file overwrites its chunks
+        doc_ids = [f"{file_hash}-{position}" for position in range(len(chunks))]
+        def documents():
+            for doc_id, chunk, embedding in zip(doc_ids, chunks, embeddings):
+                yield {
+                    'doc_id': doc_id,
+                    'text': chunk['text'],
+                    'vector': embedding,
+                    'doc_type': chunk.get('doc_type', 'text'),
+                    'page_num': chunk.get('page_num', 0),
+                    'file_name': file_name,
+                    'file_path': pdf_path,
+                    'file_hash': file_hash,
+                    'metadata': chunk
+                }
         
         # Step 5: Create index if not exists
         print("\nStep 5: Creating Elasticsearch index...")
@@ -99,7 +163,18 @@ class PDFRAGPipeline:
         
         # Step 6: Index documents
         print("\nStep 6: Indexing documents...")
-        success_count = bulk_index_documents(self.index_name, documents)
+        success_count = bulk_index_documents(self.index_name, documents())
+        
+        # Only once every new chunk is in, drop chunks of this file from an earlier
+        # ingest that weren't overwritten (auto ids, or fewer chunks this time);
+        # a failed rebuild keeps them
+        if success_count == len(chunks):
+            removed = delete_documents(self.index_name, {'bool': {
+                'filter': [{'term': {'file_hash': file_hash}}],
+                'must_not': [{'ids': {'values': doc_ids}}]
+            }})
+            if removed:
+                print(f"[Info] Removed {removed} stale chunks of {file_name}")
         
         # Get final statistics
         stats = get_index_stats(self.index_name)
@@ -112,7 +187,7 @@ class PDFRAGPipeline:
         print(f"Total documents in index: {stats.get('document_count', 'N/A')}")
         print(f"{'='*60}\n")
         
-        return {
+        result = {
             'success': True,
             'file_name': file_name,
             'chunks': len(chunks),
@@ -122,6 +197,16 @@ class PDFRAGPipeline:
             'indexed': success_count,
             'index_stats': stats
         }
+        
+        if success_count:
+            ingest_cache.setdefault(self.index_name, {})[file_hash] = {
+                'process_images': process_images,
+                'process_tables': process_tables,
+                'result': result
+            }
+            _save_ingest_cache(ingest_cache)
+        
+        return result
     
     def query(self, query: str, 
              top_k: int = None,
@@ -167,28 +252,53 @@ class PDFRAGPipeline:
         if use_query_decomposition:
             print("⚠️  Query Decomposition enabled: Queries will be slower for complex questions")
         
-        # Step 1: Coreference resolution if chat history provided
-        if chat_history:
+        queries = None
+        sub_queries = None
+        
+        num_enhancements = sum([bool(chat_history), use_rag_fusion, use_query_decomposition])
+        if num_enhancements >= 2 and RAGConfig.BATCH_QUERY_ENHANCEMENT:
+            # Step 1: One LLM request covers every enhancement step
+            print("Step 1: Enhancing query (single request)...")
+            enhanced = enhance_query(query, chat_history,
+                                     num_variations=2 if use_rag_fusion else 0,
+                                     decompose=use_query_decomposition)
+            if chat_history:
+                query = enhanced.resolved_query
+                print(f"Resolved query: {query}\n")
+            if use_rag_fusion:
+                queries = enhanced.variations
+            if use_query_decomposition:
+                sub_queries = enhanced.sub_queries
+        elif chat_history:
+            # Step 1: Coreference resolution if chat history provided
             print("Step 1: Resolving coreferences...")
             query = coreference_resolution(query, chat_history)
             print(f"Resolved query: {query}\n")
         
         # Step 2: Query enhancement
         if use_query_decomposition:
-            print("Step 2: Decomposing query...")
-            sub_queries = query_decomposition(query)
+            sub_answers = None
+            retrieve = lambda sq: self._single_query(sq, top_k, use_reranking, rerank_method)
+            if sub_queries is None and use_rag_fusion:
+                # Fusion variations are only needed if no decomposition happens, but
+                # running both LLM calls at once hides the second round-trip
+                print("Step 2: Decomposing query and generating variations concurrently...")
+                queries, sub_queries, sub_answers = asyncio.run(
+                    enhance_and_retrieve(query, retrieve, num_variations=2)
+                )
+            elif sub_queries is None:
+                print("Step 2: Decomposing query...")
+                sub_queries = query_decomposition(query)
             
             if sub_queries:
                 print(f"Query decomposed into {len(sub_queries)} sub-queries:")
                 for i, sq in enumerate(sub_queries):
                     print(f"  {i+1}. {sq}")
                 
-                # Process each sub-query
-                sub_answers = []
-                for sq in sub_queries:
-                    print(f"\nProcessing sub-query: {sq}")
-                    sub_result = self._single_query(sq, top_k, use_reranking, rerank_method)
-                    sub_answers.append(sub_result)
+                # Process the sub-queries concurrently, they are independent of each other
+                if sub_answers is None:
+                    print(f"\nProcessing {len(sub_queries)} sub-queries concurrently...")
+                    sub_answers = asyncio.run(retrieve_sub_queries(sub_queries, retrieve))
                 
                 # Generate final answer
                 print("\nGenerating final answer from sub-queries...")
@@ -203,18 +313,16 @@ class PDFRAGPipeline:
                 print("No decomposition needed, proceeding with single query\n")
         
         if use_rag_fusion:
-            print("Step 2: Generating query variations (RAG Fusion)...")
-            queries = rag_fusion(query, num_variations=2)
+            if queries is None:
+                print("Step 2: Generating query variations (RAG Fusion)...")
+                queries = rag_fusion(query, num_variations=2)
             print(f"Generated {len(queries)} query variations:")
             for i, q in enumerate(queries):
                 print(f"  {i+1}. {q}")
             
-            # Retrieve documents for each query
-            all_documents = []
-            for q in queries:
-                print(f"\nProcessing query: {q}")
-                docs = hybrid_search(q, self.index_name, top_k, self.use_openai_embedding)
-                all_documents.append(docs)
+            # Retrieve documents for every query in one batched search
+            print(f"\nRetrieving documents for {len(queries)} queries...")
+            all_documents = hybrid_search_many(queries, self.index_name, top_k, self.use_openai_embedding)
             
             # Apply reranking if requested
             if use_reranking:
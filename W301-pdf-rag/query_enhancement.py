@@ -3,73 +3,222 @@ Query enhancement module
 Implements RAG Fusion and Query Decomposition
 """
 import json
-from typing import List, Dict, Any
-from openai import OpenAI
-from config import ModelConfig
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Tuple, Optional, Callable
+import httpx
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APITimeoutError, InternalServerError
+from config import ModelConfig, RAGConfig
+from chunking import get_encoding, truncate_to_tokens
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
-def rag_fusion(query: str, num_variations: int = 2) -> List[str]:
+
+# Connection pool shared by every call so keep-alive connections are reused
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+_HTTP_TIMEOUT = 30
+
+_client: Optional[OpenAI] = None
+# Async clients are bound to the event loop that created their connections, so
+# there is one per loop; entries disappear with the loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_client_lock = threading.Lock()
+
+
+def _get_client() -> OpenAI:
+    """Return the shared OpenAI client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=ModelConfig.OPENAI_API_KEY,
+                    base_url=ModelConfig.OPENAI_BASE_URL,
+                    max_retries=0,  # retries are handled by _call_llm
+                    http_client=httpx.Client(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+                )
+    return _client
+
+
+def _get_async_client() -> AsyncOpenAI:
+    """Return the async OpenAI client for the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=ModelConfig.OPENAI_API_KEY,
+            base_url=ModelConfig.OPENAI_BASE_URL,
+            max_retries=0,  # retries are handled by _call_llm_async
+            http_client=httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT)
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the running loop's async client; call before the loop shuts down"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+# Transient errors worth retrying; bad JSON from the model is not one of them
+_RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, InternalServerError)
+
+
+def _retry_wait(attempt: int) -> float:
+    """Exponential backoff with jitter for the given retry attempt (starting at 1)"""
+    wait = min(RAGConfig.LLM_RETRY_INITIAL_WAIT * 2 ** (attempt - 1), RAGConfig.LLM_RETRY_MAX_WAIT)
+    return wait + random.uniform(0, RAGConfig.LLM_RETRY_INITIAL_WAIT)
+
+
+def _call_llm(model: str, messages: List[Dict[str, str]]) -> str:
     """
-    Generate multiple query variations for RAG Fusion
+    Request a JSON completion, retrying rate limits and timeouts with backoff
     
     Args:
-        query: Original query
-        num_variations: Number of query variations to generate
+        model: Model name
+        messages: Chat messages
         
     Returns:
-        List of query variations
+        Content of the first choice
     """
-    prompt = f'''请根据用户的查询，将其重新改写为 {num_variations} 个不同的查询。这些改写后的查询应当尽可能覆盖原始查询中的不同方面或角度，以便更全面地获取相关信息。请确保每个改写后的查询仍然与原始查询相关，并且在内容上有所不同。
+    for attempt in range(1, RAGConfig.LLM_RETRY_ATTEMPTS + 1):
+        try:
+            response = _get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"}
+            )
+            return response.choices[0].message.content
+        except _RETRYABLE_ERRORS:
+            if attempt >= RAGConfig.LLM_RETRY_ATTEMPTS:
+                raise
+            time.sleep(_retry_wait(attempt))
 
-用JSON的格式输出：
-{{
-    "queries": ["query1", "query2", ...]
-}}
 
-原始查询：{query}
-'''
+async def _call_llm_async(model: str, messages: List[Dict[str, str]]) -> str:
+    """Async version of _call_llm"""
+    for attempt in range(1, RAGConfig.LLM_RETRY_ATTEMPTS + 1):
+        try:
+            response = await _get_async_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"}
+            )
+            return response.choices[0].message.content
+        except _RETRYABLE_ERRORS:
+            if attempt >= RAGConfig.LLM_RETRY_ATTEMPTS:
+                raise
+            await asyncio.sleep(_retry_wait(attempt))
+
+
+class _LRUCache:
+    """Thread-safe LRU cache for successful LLM responses"""
     
-    try:
-        client = OpenAI(
-            api_key=ModelConfig.OPENAI_API_KEY,
-            base_url=ModelConfig.OPENAI_BASE_URL
-        )
-        
-        response = client.chat.completions.create(
-            model=ModelConfig.FAST_LLM_MODEL,
-            messages=[
-                {"role": "system", "content": "你是一个智能AI助手，专注于改写用户查询，并以 JSON 格式输出"},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        result = response.choices[0].message.content
-        parsed_result = json.loads(result)
-        variations = parsed_result.get("queries", [query])
-        
-        # Ensure we return the original query plus variations
-        if query not in variations:
-            variations.insert(0, query)
-        
-        return variations
-        
-    except Exception as e:
-        print(f"[RAG Fusion Error] {e}, returning original query")
-        return [query]
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def put(self, key: Tuple, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
 
 
-def query_decomposition(query: str) -> List[str]:
+# Only successful responses are cached, fallbacks after errors are retried next time
+_response_cache = _LRUCache(RAGConfig.QUERY_CACHE_SIZE)
+
+
+def _normalize(text: str) -> str:
+    """Normalize whitespace and case so trivially different queries share a cache entry"""
+    return " ".join(text.split()).lower()
+
+
+def _recent_history(chat_history: List[Dict[str, str]], max_tokens: int = None) -> List[Dict[str, str]]:
     """
-    Decompose complex query into sub-queries
+    Keep the most recent turns of a conversation that fit in a token budget
     
     Args:
-        query: Original complex query
+        chat_history: List of previous conversation turns
+        max_tokens: Token budget for turn contents (defaults to RAGConfig.CHAT_HISTORY_TOKENS)
         
     Returns:
-        List of sub-queries (empty list if no decomposition needed)
+        The newest turns, oldest first, whose contents fit in the budget; the
+        turn that overflows is cut to the remaining budget instead of dropped
     """
-    prompt = f'''目标：分析用户的问题，判断其是否需要拆分为子问题以提高信息检索的准确性。如果需要拆分，提供拆分后的子问题列表；如果不需要，直接返回空列表。
+    if max_tokens is None:
+        max_tokens = RAGConfig.CHAT_HISTORY_TOKENS
+    
+    encoding = get_encoding()
+    budget = max_tokens
+    kept = []
+    for turn in reversed(chat_history):
+        tokens = len(encoding.encode(turn['content']))
+        if tokens > budget:
+            if budget > 0:
+                kept.append({**turn, 'content': truncate_to_tokens(turn['content'], budget)})
+            break
+        budget -= tokens
+        kept.append(turn)
+    kept.reverse()
+    return kept
+
+
+def _history_key(chat_history: Optional[List[Dict[str, str]]]) -> Tuple:
+    """Turn chat history into a hashable cache key component"""
+    return tuple((turn['role'], turn['content']) for turn in chat_history or [])
+
+
+# Prompts are split so that instructions and few-shot examples live in a
+# byte-identical system message and only per-call values go in the user
+# message. OpenAI-compatible providers cache repeated prefixes automatically,
+# which skips prefill for the static part.
+_RAG_FUSION_SYSTEM = '''你是一个智能AI助手，专注于改写用户查询，并以 JSON 格式输出
+
+请根据用户的查询，将其重新改写为多个不同的查询。这些改写后的查询应当尽可能覆盖原始查询中的不同方面或角度，以便更全面地获取相关信息。请确保每个改写后的查询仍然与原始查询相关，并且在内容上有所不同。
+
+用JSON的格式输出：
+{
+    "queries": ["query1", "query2", ...]
+}
+'''
+
+_RAG_FUSION_TMPL = '''改写数量：{num_variations}
+原始查询：{query}
+'''
+
+
+def _rag_fusion_messages(query: str, num_variations: int) -> List[Dict[str, str]]:
+    """Build the chat messages for RAG Fusion"""
+    return [
+        {"role": "system", "content": _RAG_FUSION_SYSTEM},
+        {"role": "user", "content": _RAG_FUSION_TMPL.format(num_variations=num_variations, query=query)}
+    ]
+
+
+_DECOMP_SYSTEM = '''你是一个智能AI助手，专注于做查询拆分，并以 JSON 格式输出
+
+目标：分析用户的问题，判断其是否需要拆分为子问题以提高信息检索的准确性。如果需要拆分，提供拆分后的子问题列表；如果不需要，直接返回空列表。
 
 说明：
 - 用户的问题可能含糊不清或包含多个概念，导致难以直接回答。
@@ -80,50 +229,235 @@ def query_decomposition(query: str) -> List[str]:
 - 输出结果必须为 JSON 格式。请直接输出JSON，不需要做任何解释。
 
 输出格式：
-{{
+{
   "queries": ["子问题1", "子问题2", ...] 或 []
-}}  
+}  
 
 案例 1
 ---
 用户问题: "林冲、关羽、孙悟空的性格有什么不同？"
 推理过程: 该问题涉及多个实体的比较，需要分别了解每个实体的性格。
 输出:
-{{
+{
   "queries": ["林冲的性格是什么？", "关羽的性格是什么？", "孙悟空的性格是什么？"]
-}}
+}
 
 案例 2
 ---
 用户问题: "Covid对经济的影响是什么？"
 推理过程: 问题集中且明确，无需拆分。
 输出:
-{{
+{
   "queries": []
-}}
+}
+'''
 
-用户问题:
+_DECOMP_TMPL = '''用户问题:
 "{query}"
 '''
+
+
+def _query_decomposition_messages(query: str) -> List[Dict[str, str]]:
+    """Build the chat messages for Query Decomposition"""
+    return [
+        {"role": "system", "content": _DECOMP_SYSTEM},
+        {"role": "user", "content": _DECOMP_TMPL.format(query=query)}
+    ]
+
+
+_COREF_SYSTEM = '''你是一个智能AI助手，专注于做指代消解，并以 JSON 格式输出
+
+目标：根据提供的用户与知识库助手的历史记录，做指代消解，将用户最新问题中出现的代词或指代内容替换为历史记录中的明确对象，生成一条完整的独立问题。
+
+说明：
+- 将用户问题中的指代词替换为历史记录中的具体内容，生成一条独立问题。
+
+以JSON的格式输出
+{"query": "替换指代后的完整问题"}
+
+以下是一些案例
+
+----------
+历史记录：
+user: Milvus是什么?
+assistant: Milvus 是一个向量数据库
+用户问题：怎么使用它？
+
+输出JSON：{"query": "怎么使用Milvus?"}
+----------
+'''
+
+_COREF_TMPL = '''历史记录：
+{history_str}
+
+用户问题：{query}
+
+输出JSON：
+'''
+
+
+def _coreference_messages(query: str, chat_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Build the chat messages for Coreference Resolution"""
+    # Format chat history
+    history_str = "\n".join(f"{turn['role']}: {turn['content']}" for turn in chat_history)
+    
+    return [
+        {"role": "system", "content": _COREF_SYSTEM},
+        {"role": "user", "content": _COREF_TMPL.format(history_str=history_str, query=query)}
+    ]
+
+
+def _decode_object(result: str) -> Dict[str, Any]:
+    """Decode an LLM JSON response, raising ValueError unless it is a JSON object"""
+    parsed_result = _loads(result)
+    if not isinstance(parsed_result, dict):
+        raise ValueError(f"Expected a JSON object, got: {result[:200]}")
+    return parsed_result
+
+
+def _require(parsed_result: Dict[str, Any], key: str, expected_type: type) -> Any:
+    """
+    Fetch a field from a decoded LLM response and check its type
+    
+    Lists must contain only strings. A missing or mistyped field raises
+    ValueError so callers fall back explicitly instead of using a wrong value.
+    """
+    value = parsed_result.get(key)
+    if not isinstance(value, expected_type):
+        raise ValueError(f"Expected '{key}' to be {expected_type.__name__}, got: {value!r}")
+    if expected_type is list and not all(isinstance(item, str) for item in value):
+        raise ValueError(f"Expected '{key}' to contain only strings, got: {value!r}")
+    return value
+
+
+def _dedupe_variations(query: str, variations: List[str], num_variations: int) -> List[str]:
+    """
+    Put the original query first and drop near-duplicate variations
+    
+    Args:
+        query: Original query
+        variations: Variations returned by the LLM
+        num_variations: Number of variations requested
+        
+    Returns:
+        Unique queries in their original order, at most num_variations + 1
+    """
+    seen = set()
+    unique = []
+    for variation in [query, *variations]:
+        # Ignore case, spacing and trailing punctuation when comparing
+        key = _normalize(variation).rstrip("?？.。!！ ")
+        if key not in seen:
+            seen.add(key)
+            unique.append(variation)
+    
+    # Never let the LLM fan out more retrievals than were asked for
+    return unique[:num_variations + 1]
+
+
+def _parse_variations(result: str, query: str, num_variations: int) -> List[str]:
+    """Extract query variations from a RAG Fusion response"""
+    variations = _require(_decode_object(result), "queries", list)
+    return _dedupe_variations(query, variations, num_variations)
+
+
+def rag_fusion(query: str, num_variations: int = 2) -> List[str]:
+    """
+    Generate multiple query variations for RAG Fusion
+    
+    Args:
+        query: Original query
+        num_variations: Number of query variations to generate
+        
+    Returns:
+        List of query variations
+    """
+    # Nothing to rewrite, don't spend an LLM call
+    if not query or not query.strip() or num_variations <= 0:
+        return [query]
+    
+    cache_key = ('rag_fusion', ModelConfig.FAST_LLM_MODEL, _normalize(query), num_variations)
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
     
     try:
-        client = OpenAI(
-            api_key=ModelConfig.OPENAI_API_KEY,
-            base_url=ModelConfig.OPENAI_BASE_URL
-        )
+        content = _call_llm(ModelConfig.FAST_LLM_MODEL, _rag_fusion_messages(query, num_variations))
+        
+        variations = _parse_variations(content, query, num_variations)
+        _response_cache.put(cache_key, tuple(variations))
         
-        response = client.chat.completions.create(
-            model=ModelConfig.LLM_MODEL,
-            messages=[
-                {"role": "system", "content": "你是一个智能AI助手，专注于做查询拆分，并以 JSON 格式输出"},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
+        return variations
+        
+    except Exception as e:
+        print(f"[RAG Fusion Error] {e}, returning original query")
+        return [query]
+
+
+async def rag_fusion_async(query: str, num_variations: int = 2, timeout: float = None) -> List[str]:
+    """
+    Async version of rag_fusion
+    
+    Args:
+        query: Original query
+        num_variations: Number of query variations to generate
+        timeout: Seconds to wait for the LLM (defaults to RAGConfig.QUERY_ENHANCEMENT_TIMEOUT)
+        
+    Returns:
+        List of query variations
+    """
+    if timeout is None:
+        timeout = RAGConfig.QUERY_ENHANCEMENT_TIMEOUT
+    
+    # Nothing to rewrite, don't spend an LLM call
+    if not query or not query.strip() or num_variations <= 0:
+        return [query]
+    
+    cache_key = ('rag_fusion', ModelConfig.FAST_LLM_MODEL, _normalize(query), num_variations)
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+    
+    try:
+        content = await asyncio.wait_for(
+            _call_llm_async(ModelConfig.FAST_LLM_MODEL, _rag_fusion_messages(query, num_variations)),
+            timeout
         )
         
-        result = response.choices[0].message.content
-        parsed_result = json.loads(result)
-        sub_queries = parsed_result.get("queries", [])
+        variations = _parse_variations(content, query, num_variations)
+        _response_cache.put(cache_key, tuple(variations))
+        
+        return variations
+        
+    except Exception as e:
+        print(f"[RAG Fusion Error] {e!r}, returning original query")
+        return [query]
+
+
+def query_decomposition(query: str) -> List[str]:
+    """
+    Decompose complex query into sub-queries
+    
+    Args:
+        query: Original complex query
+        
+    Returns:
+        List of sub-queries (empty list if no decomposition needed)
+    """
+    # Very short queries never need splitting
+    if not query or len(query.strip()) < RAGConfig.MIN_DECOMPOSITION_QUERY_LENGTH:
+        return []
+    
+    cache_key = ('query_decomposition', ModelConfig.LLM_MODEL, _normalize(query))
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+    
+    try:
+        result = _call_llm(ModelConfig.LLM_MODEL, _query_decomposition_messages(query))
+        
+        sub_queries = _require(_decode_object(result), "queries", list)
+        _response_cache.put(cache_key, tuple(sub_queries))
         
         return sub_queries
         
@@ -132,6 +466,45 @@ def query_decomposition(query: str) -> List[str]:
         return []
 
 
+async def query_decomposition_async(query: str, timeout: float = None) -> List[str]:
+    """
+    Async version of query_decomposition
+    
+    Args:
+        query: Original complex query
+        timeout: Seconds to wait for the LLM (defaults to RAGConfig.QUERY_ENHANCEMENT_TIMEOUT)
+        
+    Returns:
+        List of sub-queries (empty list if no decomposition needed)
+    """
+    if timeout is None:
+        timeout = RAGConfig.QUERY_ENHANCEMENT_TIMEOUT
+    
+    # Very short queries never need splitting
+    if not query or len(query.strip()) < RAGConfig.MIN_DECOMPOSITION_QUERY_LENGTH:
+        return []
+    
+    cache_key = ('query_decomposition', ModelConfig.LLM_MODEL, _normalize(query))
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+    
+    try:
+        result = await asyncio.wait_for(
+            _call_llm_async(ModelConfig.LLM_MODEL, _query_decomposition_messages(query)),
+            timeout
+        )
+        
+        sub_queries = _require(_decode_object(result), "queries", list)
+        _response_cache.put(cache_key, tuple(sub_queries))
+        
+        return sub_queries
+        
+    except Exception as e:
+        print(f"[Query Decomposition Error] {e!r}, returning empty list")
+        return []
+
+
 def coreference_resolution(query: str, chat_history: List[Dict[str, str]]) -> str:
     """
     Resolve coreferences in query using chat history
@@ -143,97 +516,320 @@ def coreference_resolution(query: str, chat_history: List[Dict[str, str]]) -> st
     Returns:
         Resolved query
     """
-    # Format chat history
-    history_str = "\n".join([f"{turn['role']}: {turn['content']}" for turn in chat_history])
+    # Nothing to resolve against on the first turn of a conversation
+    if not chat_history:
+        return query
+    
+    # Only recent turns matter for resolving references, bound the prompt size
+    chat_history = _recent_history(chat_history)
+    if not chat_history:
+        return query
     
-    prompt = f'''目标：根据提供的用户与知识库助手的历史记录，做指代消解，将用户最新问题中出现的代词或指代内容替换为历史记录中的明确对象，生成一条完整的独立问题。
+    cache_key = ('coreference_resolution', ModelConfig.LLM_MODEL, _normalize(query), _history_key(chat_history))
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        result = _call_llm(ModelConfig.LLM_MODEL, _coreference_messages(query, chat_history))
+        
+        resolved_query = _require(_decode_object(result), "query", str)
+        _response_cache.put(cache_key, resolved_query)
+        
+        return resolved_query
+        
+    except Exception as e:
+        print(f"[Coreference Resolution Error] {e}, returning original query")
+        return query
 
-说明：
-- 将用户问题中的指代词替换为历史记录中的具体内容，生成一条独立问题。
 
-以JSON的格式输出
-{{"query": "替换指代后的完整问题"}}
+async def coreference_resolution_async(query: str, chat_history: List[Dict[str, str]],
+                                       timeout: float = None) -> str:
+    """
+    Async version of coreference_resolution
+    
+    Args:
+        query: User query with potential coreferences
+        chat_history: List of previous conversation turns
+        timeout: Seconds to wait for the LLM (defaults to RAGConfig.QUERY_ENHANCEMENT_TIMEOUT)
+        
+    Returns:
+        Resolved query
+    """
+    # Nothing to resolve against on the first turn of a conversation
+    if not chat_history:
+        return query
+    
+    # Only recent turns matter for resolving references, bound the prompt size
+    chat_history = _recent_history(chat_history)
+    if not chat_history:
+        return query
+    
+    if timeout is None:
+        timeout = RAGConfig.QUERY_ENHANCEMENT_TIMEOUT
+    
+    cache_key = ('coreference_resolution', ModelConfig.LLM_MODEL, _normalize(query), _history_key(chat_history))
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        result = await asyncio.wait_for(
+            _call_llm_async(ModelConfig.LLM_MODEL, _coreference_messages(query, chat_history)),
+            timeout
+        )
+        
+        resolved_query = _require(_decode_object(result), "query", str)
+        _response_cache.put(cache_key, resolved_query)
+        
+        return resolved_query
+        
+    except Exception as e:
+        print(f"[Coreference Resolution Error] {e!r}, returning original query")
+        return query
 
-以下是一些案例
 
-----------
+async def gather_query_enhancements(query: str, num_variations: int = 2) -> Tuple[List[str], List[str]]:
+    """
+    Run RAG Fusion and Query Decomposition concurrently
+    
+    Both only depend on the (already coreference-resolved) query, so their
+    LLM round-trips can overlap instead of running back to back.
+    
+    Args:
+        query: User query
+        num_variations: Number of query variations to generate
+        
+    Returns:
+        Tuple of (query variations, sub-queries)
+    """
+    variations, sub_queries = await asyncio.gather(
+        rag_fusion_async(query, num_variations),
+        query_decomposition_async(query),
+        return_exceptions=True
+    )
+    
+    # Each call already falls back on errors, this only guards unexpected failures
+    if isinstance(variations, BaseException):
+        variations = [query]
+    if isinstance(sub_queries, BaseException):
+        sub_queries = []
+    
+    return variations, sub_queries
+
+
+async def retrieve_sub_queries(sub_queries: List[str], retrieve: Callable[[str], Any],
+                               max_concurrency: int = None) -> List[Any]:
+    """
+    Run a blocking retrieval function for every sub-query concurrently
+    
+    Args:
+        sub_queries: Sub-queries to retrieve for
+        retrieve: Blocking function called with one sub-query (runs in a worker thread)
+        max_concurrency: Max sub-queries in flight (defaults to RAGConfig.SUB_QUERY_CONCURRENCY)
+        
+    Returns:
+        Retrieval results in the same order as sub_queries
+    """
+    if max_concurrency is None:
+        max_concurrency = RAGConfig.SUB_QUERY_CONCURRENCY
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run(sub_query: str) -> Any:
+        async with semaphore:
+            return await asyncio.to_thread(retrieve, sub_query)
+    
+    return await asyncio.gather(*[run(sq) for sq in sub_queries])
+
+
+async def decompose_and_retrieve(query: str, retrieve: Callable[[str], Any],
+                                 max_concurrency: int = None) -> Tuple[List[str], List[Any]]:
+    """
+    Decompose a query and retrieve for all sub-queries concurrently
+    
+    Args:
+        query: Original complex query
+        retrieve: Blocking function called with one sub-query (runs in a worker thread)
+        max_concurrency: Max sub-queries in flight (defaults to RAGConfig.SUB_QUERY_CONCURRENCY)
+        
+    Returns:
+        Tuple of (sub-queries, retrieval results); both empty if no decomposition is needed
+    """
+    sub_queries = await query_decomposition_async(query)
+    results = await retrieve_sub_queries(sub_queries, retrieve, max_concurrency)
+    return sub_queries, results
+
+
+async def enhance_and_retrieve(query: str, retrieve: Callable[[str], Any], num_variations: int = 2,
+                               max_concurrency: int = None) -> Tuple[List[str], List[str], List[Any]]:
+    """
+    Generate variations and sub-queries concurrently, then retrieve for every sub-query
+    
+    Both stages share one event loop, and the loop's async client is closed before returning.
+    
+    Args:
+        query: User query
+        retrieve: Blocking function called with one sub-query (runs in a worker thread)
+        num_variations: Number of query variations to generate
+        max_concurrency: Max sub-queries in flight (defaults to RAGConfig.SUB_QUERY_CONCURRENCY)
+        
+    Returns:
+        Tuple of (query variations, sub-queries, retrieval results for the sub-queries)
+    """
+    try:
+        variations, sub_queries = await gather_query_enhancements(query, num_variations)
+        results = await retrieve_sub_queries(sub_queries, retrieve, max_concurrency) if sub_queries else []
+        return variations, sub_queries, results
+    finally:
+        await close_async_client()
+
+
+@dataclass
+class EnhancedQuery:
+    """Result of a combined query enhancement request"""
+    resolved_query: str
+    variations: List[str] = field(default_factory=list)
+    sub_queries: List[str] = field(default_factory=list)
+
+
+_ENHANCE_SYSTEM = '''你是一个智能AI助手，专注于指代消解、查询改写和查询拆分，并以 JSON 格式输出
+
+目标：对用户问题做查询增强，一次性完成用户消息中列出的任务。可能的任务：
+- resolved_query：根据历史记录做指代消解，将用户问题中的代词或指代内容替换为历史记录中的明确对象，生成一条完整的独立问题。没有历史记录时原样输出用户问题。
+- variations：将 resolved_query 改写为指定数量的不同查询，尽可能覆盖其不同方面或角度，每个改写仍需与原问题相关且内容上有所不同。
+- sub_queries：判断 resolved_query 是否需要拆分为子问题。如果问题涉及多个方面（如比较多个实体、包含多个独立步骤），给出拆分后的子问题列表；如果问题已集中且明确，输出空列表。
+
+以JSON的格式输出，请直接输出JSON，不需要做任何解释：
+{
+  "resolved_query": "完整问题",
+  "variations": ["query1", "query2", ...],
+  "sub_queries": ["子问题1", "子问题2", ...] 或 []
+}
+
+案例
+---
+任务：resolved_query, variations（2 个）, sub_queries
 历史记录：
 user: Milvus是什么?
 assistant: Milvus 是一个向量数据库
-用户问题：怎么使用它？
+用户问题：它和Elasticsearch有什么不同？
+输出：
+{
+  "resolved_query": "Milvus和Elasticsearch有什么不同？",
+  "variations": ["Milvus与Elasticsearch的区别", "向量数据库Milvus和搜索引擎Elasticsearch的对比"],
+  "sub_queries": ["Milvus的特点是什么？", "Elasticsearch的特点是什么？"]
+}
+'''
 
-输出JSON：{{"query": "怎么使用Milvus?"}}
-----------
 
-历史记录：
-{history_str}
+def _enhance_query_messages(query: str, chat_history: Optional[List[Dict[str, str]]],
+                            num_variations: int, decompose: bool) -> List[Dict[str, str]]:
+    """Build the chat messages for a combined enhancement request"""
+    tasks = ["resolved_query"]
+    if num_variations > 0:
+        tasks.append(f"variations（{num_variations} 个）")
+    if decompose:
+        tasks.append("sub_queries")
+    
+    prompt = f"任务：{', '.join(tasks)}\n"
+    if chat_history:
+        prompt += "历史记录：\n" + "\n".join(f"{turn['role']}: {turn['content']}" for turn in chat_history) + "\n"
+    prompt += f"用户问题：{query}\n"
+    
+    return [
+        {"role": "system", "content": _ENHANCE_SYSTEM},
+        {"role": "user", "content": prompt}
+    ]
 
-用户问题：{query}
 
-输出JSON：
-'''
+def enhance_query(query: str, chat_history: Optional[List[Dict[str, str]]] = None,
+                  num_variations: int = 2, decompose: bool = True) -> EnhancedQuery:
+    """
+    Run coreference resolution, RAG Fusion and Query Decomposition in one LLM request
+    
+    Args:
+        query: User query
+        chat_history: Chat history for coreference resolution (skipped if empty)
+        num_variations: Number of query variations to generate (0 to skip RAG Fusion)
+        decompose: Whether to decompose the query into sub-queries
+        
+    Returns:
+        EnhancedQuery with the resolved query, variations and sub-queries
+    """
+    if chat_history:
+        chat_history = _recent_history(chat_history)
+    
+    cache_key = ('enhance_query', ModelConfig.LLM_MODEL, _normalize(query), _history_key(chat_history),
+                 num_variations, decompose)
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        resolved_query, variations, sub_queries = cached
+        return EnhancedQuery(resolved_query, list(variations), list(sub_queries))
     
     try:
-        client = OpenAI(
-            api_key=ModelConfig.OPENAI_API_KEY,
-            base_url=ModelConfig.OPENAI_BASE_URL
-        )
+        content = _call_llm(ModelConfig.LLM_MODEL, _enhance_query_messages(query, chat_history, num_variations, decompose))
         
-        response = client.chat.completions.create(
-            model=ModelConfig.LLM_MODEL,
-            messages=[
-                {"role": "system", "content": "你是一个智能AI助手，专注于做指代消解，并以 JSON 格式输出"},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"}
-        )
+        parsed_result = _decode_object(content)
+        resolved_query = _require(parsed_result, "resolved_query", str) or query
         
-        result = response.choices[0].message.content
-        parsed_result = json.loads(result)
-        resolved_query = parsed_result.get("query", query)
+        variations = []
+        if num_variations > 0:
+            variations = _dedupe_variations(
+                resolved_query, _require(parsed_result, "variations", list), num_variations
+            )
         
-        return resolved_query
+        sub_queries = _require(parsed_result, "sub_queries", list) if decompose else []
+        _response_cache.put(cache_key, (resolved_query, tuple(variations), tuple(sub_queries)))
+        
+        return EnhancedQuery(resolved_query, variations, sub_queries)
         
     except Exception as e:
-        print(f"[Coreference Resolution Error] {e}, returning original query")
-        return query
+        print(f"[Query Enhancement Error] {e}, returning original query")
+        return EnhancedQuery(query, [query] if num_variations > 0 else [], [])
 
 
-if __name__ == "__main__":
-    # Test query enhancement
+async def _main():
+    # Run all three enhancements concurrently to exercise the async paths
     test_query = "比较Python和Java的区别"
+    history = [
+        {"role": "user", "content": "什么是机器学习？"},
+        {"role": "assistant", "content": "机器学习是人工智能的一个分支，专注于让计算机从数据中学习。"}
+    ]
+    test_query_coref = "它有哪些应用？"
+    
+    variations, sub_queries, resolved = await asyncio.gather(
+        rag_fusion_async(test_query, num_variations=2),
+        query_decomposition_async(test_query),
+        coreference_resolution_async(test_query_coref, history),
+        return_exceptions=True
+    )
+    await close_async_client()
     
     print("Testing RAG Fusion...")
-    try:
-        variations = rag_fusion(test_query, num_variations=2)
+    if isinstance(variations, Exception):
+        print(f"RAG Fusion failed: {variations}")
+    else:
         print(f"Generated {len(variations)} query variations:")
         for i, var in enumerate(variations):
             print(f"  {i+1}. {var}")
-    except Exception as e:
-        print(f"RAG Fusion failed: {e}")
     
     print("\nTesting Query Decomposition...")
-    try:
-        sub_queries = query_decomposition(test_query)
-        if sub_queries:
-            print(f"Decomposed into {len(sub_queries)} sub-queries:")
-            for i, sq in enumerate(sub_queries):
-                print(f"  {i+1}. {sq}")
-        else:
-            print("No decomposition needed")
-    except Exception as e:
-        print(f"Query Decomposition failed: {e}")
+    if isinstance(sub_queries, Exception):
+        print(f"Query Decomposition failed: {sub_queries}")
+    elif sub_queries:
+        print(f"Decomposed into {len(sub_queries)} sub-queries:")
+        for i, sq in enumerate(sub_queries):
+            print(f"  {i+1}. {sq}")
+    else:
+        print("No decomposition needed")
     
     print("\nTesting Coreference Resolution...")
-    try:
-        history = [
-            {"role": "user", "content": "什么是机器学习？"},
-            {"role": "assistant", "content": "机器学习是人工智能的一个分支，专注于让计算机从数据中学习。"}
-        ]
-        test_query_coref = "它有哪些应用？"
-        resolved = coreference_resolution(test_query_coref, history)
+    if isinstance(resolved, Exception):
+        print(f"Coreference Resolution failed: {resolved}")
+    else:
         print(f"Original: {test_query_coref}")
         print(f"Resolved: {resolved}")
-    except Exception as e:
-        print(f"Coreference Resolution failed: {e}")
 
+
+if __name__ == "__main__":
+    asyncio.run(_main())
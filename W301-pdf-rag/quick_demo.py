@@ -5,6 +5,7 @@ A simple interactive tutorial to get you started
 """
 import os
 import sys
+import importlib.util
 
 def print_header(text):
     """Print a formatted header"""
@@ -30,11 +31,11 @@ def check_setup():
         'jieba', 'requests', 'langchain'
     ]
     
+    # find_spec only locates the package, it doesn't execute heavy imports like langchain
     for package in required_packages:
-        try:
-            __import__(package)
+        if importlib.util.find_spec(package) is not None:
             print(f"  ✓ {package}")
-        except ImportError:
+        else:
             print(f"  ✗ {package} - NOT INSTALLED")
             issues.append(f"Missing package: {package}")
     
@@ -62,7 +63,9 @@ def check_setup():
     try:
         from config import get_es
         es = get_es()
-        info = es.info()
+        if not es.ping():
+            raise RuntimeError('Elasticsearch unreachable')
+        info = es.info(filter_path='version.number')
         print(f"  ✓ Connected to Elasticsearch {info['version']['number']}")
     except Exception as e:
         print(f"  ✗ Cannot connect to Elasticsearch: {e}")
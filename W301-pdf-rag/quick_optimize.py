@@ -4,7 +4,33 @@ Quick Optimization Script
 Automatically optimize your PDF RAG system for better performance
 """
 import os
+import re
 import sys
+from functools import lru_cache
+from pathlib import Path
+
+# Assignments patched by apply_fast_config, tolerant of spacing around "="
+_CONFIG_PAT = re.compile(r'^(\s*(TOP_K_RETRIEVAL|TOP_K_RERANK)\s*=\s*)(\d+)', re.M)
+_ENV_PAT = re.compile(r'^(LLM_MODEL|FAST_LLM_MODEL)=.*$', re.M)
+
+FAST_CONFIG_VALUES = {'TOP_K_RETRIEVAL': 5, 'TOP_K_RERANK': 3}
+
+@lru_cache(maxsize=1)
+def ollama_model_names() -> frozenset:
+    """
+    Get the names (without tags) of locally installed Ollama models
+    
+    Returns:
+        Set of model names, e.g. {'phi', 'llama3.2'}
+        
+    Raises:
+        Exception: If the Ollama server cannot be reached
+    """
+    import requests
+    ollama_url = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+    response = requests.get(f'{ollama_url}/api/tags', timeout=2)
+    response.raise_for_status()
+    return frozenset(m['name'].split(':')[0] for m in response.json().get('models', []))
 
 def current_config():
     """Show current configuration"""
@@ -136,13 +162,12 @@ def apply_fast_config():
     # Update .env
     print("\n1. Checking for fast local model...")
     
-    import subprocess
     try:
-        result = subprocess.run(['ollama', 'list'], capture_output=True, text=True)
-        if 'phi' in result.stdout:
+        names = ollama_model_names()
+        if 'phi' in names:
             model = 'phi'
             print("   ✓ Found phi (fastest)")
-        elif 'llama3.2' in result.stdout:
+        elif 'llama3.2' in names:
             model = 'llama3.2'
             print("   ✓ Found llama3.2 (fast)")
         else:
@@ -153,49 +178,35 @@ def apply_fast_config():
         print("   ⚠️  Ollama not found, will use OpenAI")
         model = 'gpt-3.5-turbo'
     
-    # Read current .env
-    env_lines = []
+    # Update model lines in .env
+    env_path = Path('.env')
     try:
-        with open('.env', 'r') as f:
-            env_lines = f.readlines()
-    except:
+        env_content = env_path.read_text()
+    except OSError:
         print("   ⚠️  .env file not found")
         return
     
-    # Update model line
-    new_lines = []
-    for line in env_lines:
-        if line.startswith('LLM_MODEL='):
-            new_lines.append(f'LLM_MODEL={model}\n')
-            print(f"   ✓ Set LLM_MODEL={model}")
-        elif line.startswith('FAST_LLM_MODEL='):
-            new_lines.append(f'FAST_LLM_MODEL={model}\n')
-        else:
-            new_lines.append(line)
-    
-    # Write back
-    with open('.env', 'w') as f:
-        f.writelines(new_lines)
+    env_content, replaced = _ENV_PAT.subn(lambda m: f'{m.group(1)}={model}', env_content)
+    if replaced:
+        env_path.write_text(env_content)
+        print(f"   ✓ Set LLM_MODEL={model}")
     
     print("\n2. Optimizing config.py...")
     
     # Read config.py
     try:
-        with open('config.py', 'r') as f:
-            config_content = f.read()
+        config_path = Path('config.py')
+        config_content = config_path.read_text()
         
-        # Replace values
-        config_content = config_content.replace(
-            'TOP_K_RETRIEVAL = 10',
-            'TOP_K_RETRIEVAL = 5'
-        )
-        config_content = config_content.replace(
-            'TOP_K_RERANK = 5',
-            'TOP_K_RERANK = 3'
+        # Replace values in a single pass
+        config_content, replaced = _CONFIG_PAT.subn(
+            lambda m: f'{m.group(1)}{FAST_CONFIG_VALUES[m.group(2)]}',
+            config_content
         )
+        if not replaced:
+            raise ValueError("TOP_K settings not found in config.py")
         
-        with open('config.py', 'w') as f:
-            f.write(config_content)
+        config_path.write_text(config_content)
         
         print("   ✓ Reduced TOP_K_RETRIEVAL to 5")
         print("   ✓ Reduced TOP_K_RERANK to 3")
@@ -225,14 +236,20 @@ def test_performance():
         from config import get_es
         es = get_es()
         
-        # Get list of indices
-        indices = es.indices.get_alias(index="*")
+        # Get index names only (newest first) instead of every alias on the cluster,
+        # leaving out hidden and system indices such as .security-* or .ds-ilm-history-*
+        indices = [
+            row["index"]
+            for row in es.cat.indices(index="*", expand_wildcards="open", format="json",
+                                      h="index", s="creation.date:desc")
+            if not row["index"].startswith(".")
+        ]
         if not indices:
             print("⚠️  No indices found. Please ingest a PDF first.")
             return
         
         # Use first index
-        index_name = list(indices.keys())[0]
+        index_name = indices[0]
         print(f"Using index: {index_name}")
         
         pipeline = PDFRAGPipeline(index_name=index_name)
@@ -2,12 +2,203 @@
 Reranking module for improving retrieval results
 Supports both API-based and local reranking
 """
+import heapq
+import queue
+import threading
+import time
 import requests
-from typing import List, Dict, Any
+from functools import lru_cache
+from operator import itemgetter
+from typing import List, Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import ModelConfig, RAGConfig
 
 
-def rerank_with_api(query: str, documents: List[Dict[str, Any]], top_k: int = None) -> List[Dict[str, Any]]:
+# Keep-alive session for the rerank API; scoring is idempotent so POSTs may be retried
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=frozenset({'POST'}))
+)
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.mount('https://', _ADAPTER)
+
+
+def _pick_device() -> str:
+    """Pick the best available torch device for local models"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return 'cuda'
+        if getattr(torch.backends, 'mps', None) and torch.backends.mps.is_available():
+            return 'mps'
+    except ImportError:
+        pass
+    return 'cpu'
+
+
+@lru_cache(maxsize=4)
+def _get_cross_encoder(model_name: str):
+    """Load a cross-encoder model once per process and reuse it"""
+    from sentence_transformers import CrossEncoder
+    device = _pick_device()
+    
+    # On CPU an int8-quantized ONNX graph is several times faster than PyTorch FP32
+    if device == 'cpu' and ModelConfig.CROSS_ENCODER_BACKEND == 'onnx':
+        try:
+            return CrossEncoder(
+                model_name,
+                backend='onnx',
+                model_kwargs={'file_name': ModelConfig.CROSS_ENCODER_ONNX_FILE}
+            )
+        except Exception as e:
+            print(f"[Warning] Could not load ONNX cross-encoder ({e}), falling back to PyTorch")
+    
+    model = CrossEncoder(model_name, device=device)
+    if device == 'cuda':
+        # FP16 halves weight bytes and runs on tensor cores
+        model.model.half()
+    return model
+
+
+def _predict_scores(model, pairs: List[List[str]], batch_size: int) -> List[float]:
+    """
+    Score query-document pairs with smart (length-sorted) batching
+    
+    Args:
+        model: Cross-encoder model
+        pairs: Query-document pairs
+        batch_size: Pairs per forward pass
+        
+    Returns:
+        One score per pair, in the original order
+    """
+    import torch
+    
+    # Predict in length order so each minibatch pads to a similar length,
+    # then scatter the scores back to the original document order
+    order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+    with torch.inference_mode():
+        sorted_scores = model.predict([pairs[i] for i in order], batch_size=batch_size, show_progress_bar=False)
+    scores = [0.0] * len(pairs)
+    for k, i in enumerate(order):
+        scores[i] = float(sorted_scores[k])
+    return scores
+
+
+class _RerankJob:
+    """A pending rerank request waiting for the batching worker"""
+    
+    def __init__(self, pairs: List[List[str]]):
+        self.pairs = pairs
+        self.scores: Optional[List[float]] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class BatchedReranker:
+    """
+    Coalesce concurrent cross-encoder requests into a single forward pass
+    
+    A background thread takes the first pending job, drains any others that
+    arrive within max_wait_ms (up to max_jobs), scores the union of their
+    pairs with one predict call and hands each caller its slice back.
+    """
+    
+    def __init__(self, model_name: str, batch_size: int = None, max_jobs: int = None, max_wait_ms: float = None):
+        self.model_name = model_name
+        self.batch_size = batch_size or RAGConfig.RERANK_BATCH_SIZE
+        self.max_jobs = max_jobs or RAGConfig.RERANK_MAX_JOBS
+        self.max_wait = (RAGConfig.RERANK_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._queue: "queue.Queue[_RerankJob]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Score documents against a query, sharing the forward pass with concurrent callers
+        
+        Args:
+            query: Search query
+            texts: Document texts
+            
+        Returns:
+            One score per text
+        """
+        if not texts:
+            return []
+        
+        self._ensure_worker()
+        job = _RerankJob([[query, text] for text in texts])
+        self._queue.put(job)
+        job.done.wait()
+        
+        if job.error is not None:
+            raise job.error
+        return job.scores
+    
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='batched-reranker', daemon=True)
+                    self._worker.start()
+    
+    def _collect(self) -> List[_RerankJob]:
+        """Block for one job, then drain whatever else arrives within the wait window"""
+        jobs = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(jobs) < self.max_jobs:
+            remaining = deadline - time.monotonic()
+            try:
+                # With no wait window only jobs that queued up during the
+                # previous forward pass are picked up, so a lone request isn't delayed
+                jobs.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+    
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            
+            # Concatenate every job's pairs and remember where each one starts
+            pairs = []
+            offsets = []
+            for job in jobs:
+                offsets.append(len(pairs))
+                pairs.extend(job.pairs)
+            
+            try:
+                scores = _predict_scores(_get_cross_encoder(self.model_name), pairs, self.batch_size)
+                for job, offset in zip(jobs, offsets):
+                    job.scores = scores[offset:offset + len(job.pairs)]
+            except Exception as e:
+                for job in jobs:
+                    job.error = e
+            finally:
+                for job in jobs:
+                    job.done.set()
+
+
+@lru_cache(maxsize=4)
+def _get_batched_reranker(model_name: str, batch_size: int) -> BatchedReranker:
+    """Return the shared BatchedReranker for a model"""
+    return BatchedReranker(model_name, batch_size=batch_size)
+
+
+def _nothing_to_rerank(documents: List[Dict[str, Any]], top_k: int, force: bool) -> bool:
+    """
+    A single document never needs reranking, and unless forced neither does a
+    list that already fits in top_k (the answer set is the same either way)
+    """
+    return len(documents) <= 1 or (not force and len(documents) <= top_k)
+
+
+def rerank_with_api(query: str, documents: List[Dict[str, Any]], top_k: int = None,
+                    force: bool = False) -> List[Dict[str, Any]]:
     """
     Rerank documents using an external reranking API
     
@@ -15,6 +206,7 @@ def rerank_with_api(query: str, documents: List[Dict[str, Any]], top_k: int = No
         query: Search query
         documents: List of retrieved documents
         top_k: Number of top results to return
+        force: Rerank even when every document would be returned anyway
         
     Returns:
         Reranked list of documents
@@ -25,12 +217,16 @@ def rerank_with_api(query: str, documents: List[Dict[str, Any]], top_k: int = No
     if not documents:
         return []
     
+    # Nothing would be cut, skip the API call
+    if _nothing_to_rerank(documents, top_k, force):
+        return documents[:top_k]
+    
     try:
         # Extract text from documents
         doc_texts = [doc.get('text', '') for doc in documents]
         
         # Call reranking API
-        response = requests.post(
+        response = _SESSION.post(
             ModelConfig.RERANK_URL,
             json={"query": query, "documents": doc_texts},
             timeout=30
@@ -43,8 +239,8 @@ def rerank_with_api(query: str, documents: List[Dict[str, Any]], top_k: int = No
             for idx, doc in enumerate(documents):
                 documents[idx]['rerank_score'] = result['scores'][idx]
             
-            # Sort by rerank score (descending)
-            documents.sort(key=lambda x: x.get('rerank_score', 0), reverse=True)
+            # Only the top-k by rerank score (descending) are needed
+            return heapq.nlargest(top_k, documents, key=itemgetter('rerank_score'))
         
         return documents[:top_k]
         
@@ -53,7 +249,8 @@ def rerank_with_api(query: str, documents: List[Dict[str, Any]], top_k: int = No
         return documents[:top_k]
 
 
-def rerank_with_cross_encoder(query: str, documents: List[Dict[str, Any]], top_k: int = None, model_name: str = None) -> List[Dict[str, Any]]:
+def rerank_with_cross_encoder(query: str, documents: List[Dict[str, Any]], top_k: int = None, model_name: str = None,
+                              batch_size: int = None, force: bool = False) -> List[Dict[str, Any]]:
     """
     Rerank documents using a local cross-encoder model
     
@@ -62,47 +259,47 @@ def rerank_with_cross_encoder(query: str, documents: List[Dict[str, Any]], top_k
         documents: List of retrieved documents
         top_k: Number of top results to return
         model_name: Name of the cross-encoder model
+        batch_size: Pairs per forward pass (defaults to RAGConfig.RERANK_BATCH_SIZE)
+        force: Rerank even when every document would be returned anyway
         
     Returns:
         Reranked list of documents
     """
     if top_k is None:
         top_k = RAGConfig.TOP_K_RERANK
+    if batch_size is None:
+        batch_size = RAGConfig.RERANK_BATCH_SIZE
     
     if not documents:
         return []
     
+    # Nothing would be cut, skip model inference
+    if _nothing_to_rerank(documents, top_k, force):
+        return documents[:top_k]
+    
     try:
-        from sentence_transformers import CrossEncoder
-        
         # Use default model if not specified
         if model_name is None:
             model_name = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
         
-        # Load model (consider caching this)
-        model = CrossEncoder(model_name)
-        
-        # Prepare query-document pairs
-        pairs = [[query, doc.get('text', '')] for doc in documents]
-        
-        # Get reranking scores
-        scores = model.predict(pairs)
+        # Concurrent callers share one forward pass on the cached model
+        reranker = _get_batched_reranker(model_name, batch_size)
+        scores = reranker.score(query, [doc.get('text', '') for doc in documents])
         
         # Add scores to documents
         for idx, doc in enumerate(documents):
-            documents[idx]['rerank_score'] = float(scores[idx])
-        
-        # Sort by rerank score (descending)
-        documents.sort(key=lambda x: x.get('rerank_score', 0), reverse=True)
+            documents[idx]['rerank_score'] = scores[idx]
         
-        return documents[:top_k]
+        # Only the top-k by rerank score (descending) are needed
+        return heapq.nlargest(top_k, documents, key=itemgetter('rerank_score'))
         
     except Exception as e:
         print(f"[Cross-Encoder Reranking Error] {e}, returning original order")
         return documents[:top_k]
 
 
-def rerank_documents(query: str, documents: List[Dict[str, Any]], method: str = 'api', top_k: int = None) -> List[Dict[str, Any]]:
+def rerank_documents(query: str, documents: List[Dict[str, Any]], method: str = 'api', top_k: int = None,
+                     force: bool = False) -> List[Dict[str, Any]]:
     """
     Rerank documents using specified method
     
@@ -111,6 +308,7 @@ def rerank_documents(query: str, documents: List[Dict[str, Any]], method: str =
         documents: List of retrieved documents
         method: Reranking method ('api' or 'cross_encoder')
         top_k: Number of top results to return
+        force: Rerank even when every document would be returned anyway
         
     Returns:
         Reranked list of documents
@@ -119,9 +317,9 @@ def rerank_documents(query: str, documents: List[Dict[str, Any]], method: str =
         return []
     
     if method == 'api':
-        return rerank_with_api(query, documents, top_k)
+        return rerank_with_api(query, documents, top_k, force=force)
     elif method == 'cross_encoder':
-        return rerank_with_cross_encoder(query, documents, top_k)
+        return rerank_with_cross_encoder(query, documents, top_k, force=force)
     else:
         print(f"[Warning] Unknown reranking method: {method}, returning original order")
         return documents[:top_k if top_k else RAGConfig.TOP_K_RERANK]
@@ -150,7 +348,7 @@ if __name__ == "__main__":
     
     print("Testing API-based reranking...")
     try:
-        reranked = rerank_with_api(test_query, test_docs.copy(), top_k=3)
+        reranked = rerank_with_api(test_query, test_docs.copy(), top_k=3, force=True)
         print(f"Reranked {len(reranked)} documents")
         for i, doc in enumerate(reranked):
             print(f"{i+1}. (Score: {doc.get('rerank_score', 'N/A'):.4f}) {doc['text'][:50]}...")
@@ -159,7 +357,7 @@ if __name__ == "__main__":
     
     print("\nTesting Cross-Encoder reranking...")
     try:
-        reranked = rerank_with_cross_encoder(test_query, test_docs.copy(), top_k=3)
+        reranked = rerank_with_cross_encoder(test_query, test_docs.copy(), top_k=3, force=True)
         print(f"Reranked {len(reranked)} documents")
         for i, doc in enumerate(reranked):
             print(f"{i+1}. (Score: {doc.get('rerank_score', 'N/A'):.4f}) {doc['text'][:50]}...")
@@ -2,14 +2,19 @@
 Retrieval module with hybrid search (BM25 + vector) and RRF
 """
 import re
+import heapq
+import threading
 import jieba
-from typing import List, Dict, Any
-from config import get_es, RAGConfig
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain
+from typing import List, Dict, Any, Tuple
+from config import get_es, ModelConfig, RAGConfig
 from embedding import local_embedding
 
 
 # Chinese stop words for keyword extraction
-STOP_WORDS = set([
+STOP_WORDS = frozenset([
     "的", "了", "在", "是", "我", "有", "和", "就", "不", "人", "都", "一", "一个", "上", "也", "很", "到", "说", "要", "去", "你", "会", "着", "没有", "看", "与", "如何",
     "为", "得", "里", "后", "自己", "之", "过", "给", "然后", "那", "下", "能", "而", "来", "个", "这", "之间", "应该", "可以", "到", "由", "及", "对", "中", "会",
     "但", "年", "还", "并", "如果", "我们", "为了", "而且", "或者", "因为", "所以", "对于", "而言", "与否", "只是", "已经", "可能", "同时", "比如", "这样", "当然",
@@ -18,6 +23,32 @@ STOP_WORDS = set([
     "尽管", "何况", "不会", "何以", "怎样", "为何", "此外", "其中", "怎么", "什么", "为什么", "是否", '。', '？', '！', '.', '?', '!', '，', ',', " ", ""
 ])
 
+# Load the jieba dictionary at import instead of on the first query
+jieba.initialize()
+
+# Embeddings dominate hit size and are never read back from search results
+_SOURCE_EXCLUDES = ['vector']
+
+
+# Subtitle-style timestamps (e.g. "00:01.000 --> 00:04.000") left in indexed text
+TIMESTAMP_PATTERN = re.compile(r'\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}\.\d{3}')
+
+
+def _strip_timestamps(text: str) -> str:
+    """Remove timestamps from text, skipping the regex when there can't be any"""
+    if '-->' not in text:
+        return text
+    return TIMESTAMP_PATTERN.sub('', text)
+
+
+@lru_cache(maxsize=4096)
+def _segment_keywords(query: str) -> Tuple[str, ...]:
+    """Segment a query with jieba and drop stop words (cached, queries repeat across fusion/decomposition)"""
+    # Use search mode for better keyword extraction
+    seg_list = jieba.cut_for_search(query)
+    # Filter out stop words
+    return tuple(word for word in seg_list if word not in STOP_WORDS and word.strip())
+
 
 def get_keywords(query: str) -> List[str]:
     """
@@ -36,75 +67,111 @@ def get_keywords(query: str) -> List[str]:
         return []
     
     try:
-        # Use search mode for better keyword extraction
-        seg_list = jieba.cut_for_search(query)
-        # Filter out stop words
-        filtered_keywords = [word for word in seg_list if word not in STOP_WORDS and word.strip()]
-        return filtered_keywords
+        return list(_segment_keywords(query))
     except Exception as e:
         print(f'[Get Keywords Error] {e}')
         return [query]
 
 
-def keyword_search(query: str, index_name: str, top_k: int = None) -> List[Dict[str, Any]]:
-    """
-    Perform BM25 keyword search
-    
-    Args:
-        query: Search query
-        index_name: Elasticsearch index name
-        top_k: Number of results to return
-        
-    Returns:
-        List of search results with ranks
-    """
-    if top_k is None:
-        top_k = RAGConfig.TOP_K_RETRIEVAL
-    
-    es = get_es()
+def _keyword_query(query: str) -> Dict[str, Any]:
+    """Build the BM25 query for a search query"""
     keywords = get_keywords(query)
     
     if not keywords:
         keywords = [query]
     
-    # Build BM25 query
-    keyword_query = {
-        "bool": {
-            "should": [
-                {"match": {"text": {"query": keyword, "fuzziness": "AUTO"}}} 
-                for keyword in keywords
-            ],
-            "minimum_should_match": 1
+    # One match over all keywords: ES builds a single fuzzy query per term instead of
+    # one clause per keyword (AUTO fuzziness leaves 1-2 character terms exact)
+    return {
+        "match": {
+            "text": {
+                "query": " ".join(keywords),
+                "fuzziness": "AUTO",
+                "operator": "or",
+                "minimum_should_match": "1"
+            }
         }
     }
+
+
+# Recently used query embeddings, keyed by (embedding backend, query)
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+
+def _embedding_backend(use_openai: bool) -> str:
+    """Identify the model producing query embeddings so cached vectors never cross models"""
+    return 'openai:text-embedding-3-large' if use_openai else ModelConfig.EMBEDDING_URL
+
+
+def _query_embeddings(queries: List[str], use_openai: bool = False) -> List[List[float]]:
+    """Embed search queries, sending only uncached ones in a single embedding request"""
+    backend = _embedding_backend(use_openai)
+    
+    with _embedding_cache_lock:
+        cached = {}
+        for query in queries:
+            if (backend, query) in _embedding_cache:
+                _embedding_cache.move_to_end((backend, query))
+                cached[query] = _embedding_cache[(backend, query)]
     
-    res = es.search(index=index_name, query=keyword_query, size=top_k)
+    missing = list(dict.fromkeys(query for query in queries if query not in cached))
+    if missing:
+        if use_openai:
+            from embedding import openai_embedding
+            embeddings = openai_embedding(missing)
+        else:
+            embeddings = local_embedding(missing)
+        
+        with _embedding_cache_lock:
+            for query, embedding in zip(missing, embeddings):
+                cached[query] = embedding
+                _embedding_cache[(backend, query)] = embedding
+                _embedding_cache.move_to_end((backend, query))
+            while len(_embedding_cache) > RAGConfig.QUERY_EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
     
-    # Format results
+    return [cached[query] for query in queries]
+
+
+def _knn_query(embedding: List[float], top_k: int) -> Dict[str, Any]:
+    """Build an approximate kNN query over the HNSW-indexed vector field"""
+    return {
+        "field": "vector",
+        "query_vector": embedding,
+        "k": top_k,
+        "num_candidates": max(top_k * 10, 100)
+    }
+
+
+def _format_hits(res: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Convert an Elasticsearch search response into ranked hits"""
     hits = []
     for idx, hit in enumerate(res['hits']['hits']):
+        source = hit['_source']
+        # Safety net for callers that didn't exclude the vector: never carry it around
+        if 'vector' in source:
+            source = {key: value for key, value in source.items() if key != 'vector'}
         hits.append({
             'id': hit['_id'],
-            'text': hit['_source'].get('text', ''),
-            'doc_type': hit['_source'].get('doc_type', 'text'),
-            'page_num': hit['_source'].get('page_num', 0),
-            'metadata': hit['_source'],
+            'text': source.get('text', ''),
+            'doc_type': source.get('doc_type', 'text'),
+            'page_num': source.get('page_num', 0),
+            'metadata': source,
             'rank': idx + 1,
             'score': hit['_score']
         })
-    
     return hits
 
 
-def vector_search(query: str, index_name: str, top_k: int = None, use_openai: bool = False) -> List[Dict[str, Any]]:
+def keyword_search(query: str, index_name: str, top_k: int = None) -> List[Dict[str, Any]]:
     """
-    Perform vector similarity search
+    Perform BM25 keyword search
     
     Args:
         query: Search query
         index_name: Elasticsearch index name
         top_k: Number of results to return
-        use_openai: Whether to use OpenAI embeddings
         
     Returns:
         List of search results with ranks
@@ -113,44 +180,36 @@ def vector_search(query: str, index_name: str, top_k: int = None, use_openai: bo
         top_k = RAGConfig.TOP_K_RETRIEVAL
     
     es = get_es()
+    res = es.search(index=index_name, query=_keyword_query(query), size=top_k, source_excludes=_SOURCE_EXCLUDES)
     
-    # Get query embedding
-    if use_openai:
-        from embedding import openai_embedding
-        embedding = openai_embedding([query])[0]
-    else:
-        embedding = local_embedding([query])[0]
-    
-    # Build vector query
-    vector_query = {
-        "script_score": {
-            "query": {"match_all": {}},
-            "script": {
-                "source": "cosineSimilarity(params.queryVector, 'vector') + 1.0",
-                "params": {"queryVector": embedding}
-            }
-        }
-    }
+    return _format_hits(res)
+
+
+def vector_search(query: str, index_name: str, top_k: int = None, use_openai: bool = False) -> List[Dict[str, Any]]:
+    """
+    Perform vector similarity search
     
-    res = es.search(index=index_name, query=vector_query, size=top_k)
+    Args:
+        query: Search query
+        index_name: Elasticsearch index name
+        top_k: Number of results to return
+        use_openai: Whether to use OpenAI embeddings
+        
+    Returns:
+        List of search results with ranks
+    """
+    if top_k is None:
+        top_k = RAGConfig.TOP_K_RETRIEVAL
     
-    # Format results
-    hits = []
-    for idx, hit in enumerate(res['hits']['hits']):
-        hits.append({
-            'id': hit['_id'],
-            'text': hit['_source'].get('text', ''),
-            'doc_type': hit['_source'].get('doc_type', 'text'),
-            'page_num': hit['_source'].get('page_num', 0),
-            'metadata': hit['_source'],
-            'rank': idx + 1,
-            'score': hit['_score']
-        })
+    es = get_es()
+    embedding = _query_embeddings([query], use_openai)[0]
+    res = es.search(index=index_name, knn=_knn_query(embedding, top_k), size=top_k, source_excludes=_SOURCE_EXCLUDES)
     
-    return hits
+    return _format_hits(res)
 
 
-def hybrid_search_rrf(keyword_hits: List[Dict], vector_hits: List[Dict], k: int = None) -> List[Dict[str, Any]]:
+def hybrid_search_rrf(keyword_hits: List[Dict], vector_hits: List[Dict], k: int = None,
+                      top_k: int = None) -> List[Dict[str, Any]]:
     """
     Combine keyword and vector search results using Reciprocal Rank Fusion (RRF)
     
@@ -158,6 +217,7 @@ def hybrid_search_rrf(keyword_hits: List[Dict], vector_hits: List[Dict], k: int
         keyword_hits: Results from keyword search
         vector_hits: Results from vector search
         k: RRF constant (default from config)
+        top_k: Number of results to return (default all)
         
     Returns:
         Combined and ranked results
@@ -165,56 +225,34 @@ def hybrid_search_rrf(keyword_hits: List[Dict], vector_hits: List[Dict], k: int
     if k is None:
         k = RAGConfig.RRF_K
     
-    # Initialize score dictionary
+    # Accumulate plain float scores; the first hit seen for a document supplies its payload
     scores = {}
-    
-    # Process keyword hits
-    for hit in keyword_hits:
-        doc_id = hit['id']
-        if doc_id not in scores:
-            scores[doc_id] = {
-                'score': 0,
-                'text': hit['text'],
-                'id': doc_id,
-                'doc_type': hit['doc_type'],
-                'page_num': hit['page_num'],
-                'metadata': hit['metadata']
-            }
-        scores[doc_id]['score'] += 1 / (k + hit['rank'])
-    
-    # Process vector hits
-    for hit in vector_hits:
+    payloads = {}
+    for hit in chain(keyword_hits, vector_hits):
         doc_id = hit['id']
-        if doc_id not in scores:
-            scores[doc_id] = {
-                'score': 0,
-                'text': hit['text'],
-                'id': doc_id,
-                'doc_type': hit['doc_type'],
-                'page_num': hit['page_num'],
-                'metadata': hit['metadata']
-            }
-        scores[doc_id]['score'] += 1 / (k + hit['rank'])
+        score = scores.get(doc_id)
+        if score is None:
+            payloads[doc_id] = hit
+            score = 0.0
+        scores[doc_id] = score + 1.0 / (k + hit['rank'])
     
-    # Sort by RRF score
-    ranked_docs = sorted(scores.values(), key=lambda x: x['score'], reverse=True)
-    
-    # Clean up text (remove timestamps if any)
-    timestamp_pattern = re.compile(r'\d{2}:\d{2}\.\d{3} --> \d{2}:\d{2}\.\d{3}')
-    for doc in ranked_docs:
-        doc['text'] = re.sub(timestamp_pattern, '', doc['text'])
+    # Partial sort: only the requested top-k need ordering (ties keep first-seen order)
+    if top_k is None:
+        top_k = len(scores)
+    top_ids = heapq.nlargest(top_k, scores, key=scores.get)
     
     # Format final results
     final_results = []
-    for idx, doc in enumerate(ranked_docs):
+    for idx, doc_id in enumerate(top_ids):
+        hit = payloads[doc_id]
         final_results.append({
-            'id': doc['id'],
-            'text': doc['text'],
-            'doc_type': doc['doc_type'],
-            'page_num': doc['page_num'],
-            'metadata': doc['metadata'],
+            'id': doc_id,
+            'text': _strip_timestamps(hit['text']),
+            'doc_type': hit['doc_type'],
+            'page_num': hit['page_num'],
+            'metadata': hit['metadata'],
             'rank': idx + 1,
-            'rrf_score': doc['score']
+            'rrf_score': scores[doc_id]
         })
     
     return final_results
@@ -233,18 +271,56 @@ def hybrid_search(query: str, index_name: str, top_k: int = None, use_openai: bo
     Returns:
         Ranked search results
     """
+    return hybrid_search_many([query], index_name, top_k, use_openai)[0]
+
+
+def hybrid_search_many(queries: List[str], index_name: str, top_k: int = None,
+                       use_openai: bool = False) -> List[List[Dict[str, Any]]]:
+    """
+    Run hybrid search for several queries at once (e.g. RAG Fusion variations)
+    
+    All queries are embedded in one request and all BM25 and kNN searches are
+    sent in one _msearch, so per-query overhead is paid once for the batch.
+    
+    Args:
+        queries: Search queries
+        index_name: Elasticsearch index name
+        top_k: Number of results to return per query
+        use_openai: Whether to use OpenAI embeddings
+        
+    Returns:
+        Ranked search results for each query, in the same order as queries
+    """
     if top_k is None:
         top_k = RAGConfig.TOP_K_RETRIEVAL
     
-    # Perform both searches
-    keyword_hits = keyword_search(query, index_name, top_k)
-    vector_hits = vector_search(query, index_name, top_k, use_openai)
+    if not queries:
+        return []
+    
+    es = get_es()
+    embeddings = _query_embeddings(queries, use_openai)
+    
+    # Keyword and kNN search for every query, in a single round-trip
+    searches = []
+    for query, embedding in zip(queries, embeddings):
+        searches.extend([
+            {"index": index_name},
+            {"query": _keyword_query(query), "size": top_k, "_source": {"excludes": _SOURCE_EXCLUDES}},
+            {"index": index_name},
+            {"knn": _knn_query(embedding, top_k), "size": top_k, "_source": {"excludes": _SOURCE_EXCLUDES}}
+        ])
+    res = es.msearch(searches=searches)
     
-    # Combine with RRF
-    combined_results = hybrid_search_rrf(keyword_hits, vector_hits)
+    responses = res['responses']
+    for response in responses:
+        if 'error' in response:
+            raise RuntimeError(f"Hybrid search failed: {response['error']}")
     
-    # Return top-k
-    return combined_results[:top_k]
+    # Combine each query's keyword and vector hits with RRF, keeping only the top-k
+    return [
+        hybrid_search_rrf(_format_hits(responses[i]), _format_hits(responses[i + 1]), top_k=top_k)
+        for i in range(0, len(responses), 2)
+    ]
 
 
 if __name__ == "__main__":
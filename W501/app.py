@@ -4,12 +4,11 @@ FastAPI Web Application for LangChain RAG
 """
 
 import os
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import asyncio
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import tempfile
-import shutil
 
 from langchain_rag import LangChainRAG, create_rag
 
@@ -24,19 +23,79 @@ app = FastAPI(
 # Use OpenAI in production (AWS), Ollama for local development
 USE_OLLAMA = os.getenv("USE_OLLAMA", "true").lower() == "true"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-
-rag = None
-
-
-def get_rag():
-    """Get or create RAG instance"""
-    global rag
-    if rag is None:
-        if USE_OLLAMA:
-            rag = create_rag(use_ollama=True, persist_directory="./faiss_index")
-        else:
-            rag = create_rag(use_ollama=False, persist_directory="./faiss_index")
-    return rag
+# Store vectors as int8 codes (4x less memory per vector, <1% recall loss typically)
+FAISS_QUANTIZE = os.getenv("FAISS_QUANTIZE", "false").lower() == "true"
+# Memory-map the persisted index (shared page cache across uvicorn workers)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "false").lower() == "true"
+# Optional FAISS index_factory string for new indexes, e.g. "IVF1024,PQ32" (default: HNSW)
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY") or None
+# Optional small Ollama model that drafts answers while the main model runs, e.g. "llama3.2:1b"
+DRAFT_MODEL = os.getenv("DRAFT_MODEL") or None
+# Answer /search via a 1-bit Hamming prefilter plus exact rerank (large corpora)
+FAISS_BINARY_PREFILTER = os.getenv("FAISS_BINARY_PREFILTER", "false").lower() == "true"
+# Reuse answers for questions at least this similar to an earlier one, e.g. 0.95 (off by default)
+QUERY_CACHE_THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD")) if os.getenv("QUERY_CACHE_THRESHOLD") else None
+
+# Cap concurrent LLM/embedding calls so bursts don't trip provider rate limits
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+# Query embeddings arriving within this window are sent in one embedding request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT = float(os.getenv("EMBED_BATCH_WAIT_MS", "10")) / 1000
+
+
+class QueryEmbeddingBatcher:
+    """
+    Micro-batch query embeddings across concurrent requests
+    
+    Requests enqueue their question and await a future. A background task
+    collects up to EMBED_BATCH_SIZE questions or waits EMBED_BATCH_WAIT,
+    embeds them with one call and resolves each future with its vector.
+    """
+    
+    def __init__(self, max_batch: int = EMBED_BATCH_SIZE, max_wait: float = EMBED_BATCH_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue = asyncio.Queue()
+    
+    async def embed(self, text: str) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+    
+    async def run(self, rag_instance: LangChainRAG):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                async with llm_semaphore:
+                    embeddings = await rag_instance.aembed_queries([text for text, _ in batch])
+                for (_, future), embedding in zip(batch, embeddings):
+                    if not future.done():
+                        future.set_result(embedding)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+query_batcher = QueryEmbeddingBatcher()
+
+
+async def _get_rag(request: Request) -> LangChainRAG:
+    """Endpoint dependency returning the RAG instance built once at startup"""
+    return request.app.state.rag
 
 
 # Request/Response models
@@ -62,15 +121,25 @@ class IngestResponse(BaseModel):
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize RAG on startup"""
-    get_rag()
+    """Initialize RAG on startup so the first request doesn't pay for it"""
+    app.state.rag = create_rag(
+        use_ollama=USE_OLLAMA,
+        persist_directory="./faiss_index",
+        quantize_vectors=FAISS_QUANTIZE,
+        mmap_index=FAISS_MMAP,
+        index_factory=FAISS_INDEX_FACTORY,
+        draft_model=DRAFT_MODEL,
+        binary_prefilter=FAISS_BINARY_PREFILTER,
+        query_cache_threshold=QUERY_CACHE_THRESHOLD
+    )
+    # Keep a reference so the batching task isn't garbage collected
+    app.state.embed_batch_task = asyncio.create_task(query_batcher.run(app.state.rag))
     print("✓ RAG system initialized")
 
 
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(rag_instance: LangChainRAG = Depends(_get_rag)):
     """Health check endpoint"""
-    rag_instance = get_rag()
     return HealthResponse(
         status="healthy",
         documents=rag_instance.get_document_count()
@@ -93,13 +162,11 @@ async def root():
 
 
 @app.post("/query", response_model=QueryResponse)
-async def query(request: QueryRequest):
+async def query(request: QueryRequest, rag_instance: LangChainRAG = Depends(_get_rag)):
     """
     Query the RAG system
     向 RAG 系统提问
     """
-    rag_instance = get_rag()
-    
     if rag_instance.get_document_count() == 0:
         raise HTTPException(
             status_code=400,
@@ -107,7 +174,9 @@ async def query(request: QueryRequest):
         )
     
     try:
-        result = rag_instance.query(request.question)
+        embedding = await query_batcher.embed(request.question)
+        async with llm_semaphore:
+            result = await rag_instance.aquery(request.question, embedding=embedding)
         
         # Format sources
         sources = []
@@ -127,7 +196,7 @@ async def query(request: QueryRequest):
 
 
 @app.post("/upload", response_model=IngestResponse)
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(file: UploadFile = File(...), rag_instance: LangChainRAG = Depends(_get_rag)):
     """
     Upload and process a PDF file
     上传并处理 PDF 文件
@@ -135,20 +204,11 @@ async def upload_pdf(file: UploadFile = File(...)):
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
-    rag_instance = get_rag()
-    
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-        
-        # Process the PDF
-        chunks = rag_instance.load_pdf(tmp_path)
-        rag_instance.add_documents(chunks)
-        
-        # Clean up
-        os.unlink(tmp_path)
+        # Parse the PDF straight from memory, off the event loop
+        data = await file.read()
+        chunks = await asyncio.to_thread(rag_instance.load_pdf_bytes, data, file.filename)
+        await asyncio.to_thread(rag_instance.add_documents, chunks)
         
         return IngestResponse(
             message=f"Successfully processed {file.filename}",
@@ -159,13 +219,11 @@ async def upload_pdf(file: UploadFile = File(...)):
 
 
 @app.post("/search")
-async def similarity_search(request: QueryRequest):
+async def similarity_search(request: QueryRequest, rag_instance: LangChainRAG = Depends(_get_rag)):
     """
     Perform similarity search without LLM
     执行相似度搜索（不使用 LLM）
     """
-    rag_instance = get_rag()
-    
     if rag_instance.get_document_count() == 0:
         raise HTTPException(
             status_code=400,
@@ -173,7 +231,8 @@ async def similarity_search(request: QueryRequest):
         )
     
     try:
-        docs = rag_instance.similarity_search(request.question, k=request.top_k)
+        embedding = await query_batcher.embed(request.question)
+        docs = await rag_instance.asimilarity_search(request.question, k=request.top_k, embedding=embedding)
         
         results = []
         for doc in docs:
@@ -189,13 +248,13 @@ async def similarity_search(request: QueryRequest):
 
 
 @app.delete("/clear")
-async def clear_database():
+async def clear_database(rag_instance: LangChainRAG = Depends(_get_rag)):
     """
     Clear the vector database
     清空向量数据库
     """
-    rag_instance = get_rag()
-    rag_instance.clear_database()
+    # Waits for in-flight searches and adds, so keep it off the event loop
+    await asyncio.to_thread(rag_instance.clear_database)
     return {"message": "Database cleared"}
 
 
@@ -8,6 +8,7 @@ This script provides an interactive interface for the LangChain RAG system.
 
 import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 
@@ -24,38 +25,87 @@ class Colors:
     END = '\033[0m'
 
 
+# Banner, menu and message templates are rendered once at import so the
+# interactive loop only writes pre-built strings
+_BANNER_STR = (
+    f"\n{Colors.BOLD}{Colors.CYAN}\n"
+    "╔══════════════════════════════════════════════════════════════╗\n"
+    "║          🤖 LangChain RAG 问答系统                           ║\n"
+    "║          Simple PDF Question Answering                       ║\n"
+    "╚══════════════════════════════════════════════════════════════╝\n"
+    f"{Colors.END}\n"
+)
+
+_RULE = f"{Colors.BOLD}{'─'*60}{Colors.END}"
+_MENU_STR = (
+    f"\n{_RULE}\n"
+    f"{Colors.BOLD}主菜单 / Main Menu:{Colors.END}\n"
+    "  1. 📄 加载 PDF 文档 (Load PDF)\n"
+    "  2. 📁 加载文件夹 (Load Directory)\n"
+    "  3. ❓ 提问 (Ask Question)\n"
+    "  4. 🔍 搜索相关内容 (Search)\n"
+    "  5. 📊 查看状态 (Status)\n"
+    "  6. 🗑️  清除数据库 (Clear Database)\n"
+    "  7. 👋 退出 (Exit)\n"
+    f"{_RULE}\n"
+)
+_CHOICE_PROMPT = f"\n{Colors.GREEN}请选择 (1-7): {Colors.END}"
+_QUESTION_PROMPT = f"\n{Colors.GREEN}问题: {Colors.END}"
+_ANSWER_HEADER = f"\n{Colors.BOLD}{Colors.CYAN}回答:{Colors.END}\n"
+
+# Flatten whitespace in source snippets in one C-level pass
+_SNIPPET_TABLE = str.maketrans({'\n': ' ', '\r': ' ', '\t': ' '})
+
+_SUCCESS_FMT = f"{Colors.GREEN}✓ {{}}{Colors.END}\n"
+_ERROR_FMT = f"{Colors.RED}✗ {{}}{Colors.END}\n"
+_INFO_FMT = f"{Colors.CYAN}ℹ {{}}{Colors.END}\n"
+_WARNING_FMT = f"{Colors.YELLOW}⚠ {{}}{Colors.END}\n"
+
+
+def _write(text: str):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
 def print_banner():
     """Print welcome banner"""
-    print(f"\n{Colors.BOLD}{Colors.CYAN}")
-    print("╔══════════════════════════════════════════════════════════════╗")
-    print("║          🤖 LangChain RAG 问答系统                           ║")
-    print("║          Simple PDF Question Answering                       ║")
-    print("╚══════════════════════════════════════════════════════════════╝")
-    print(Colors.END)
+    _write(_BANNER_STR)
 
 
 def print_success(msg: str):
-    print(f"{Colors.GREEN}✓ {msg}{Colors.END}")
+    _write(_SUCCESS_FMT.format(msg))
 
 
 def print_error(msg: str):
-    print(f"{Colors.RED}✗ {msg}{Colors.END}")
+    _write(_ERROR_FMT.format(msg))
 
 
 def print_info(msg: str):
-    print(f"{Colors.CYAN}ℹ {msg}{Colors.END}")
+    _write(_INFO_FMT.format(msg))
 
 
 def print_warning(msg: str):
-    print(f"{Colors.YELLOW}⚠ {msg}{Colors.END}")
+    _write(_WARNING_FMT.format(msg))
+
+
+@lru_cache(maxsize=1)
+def _http_session():
+    """Keep-alive HTTP session reused by every Ollama probe (requests is imported on first use)"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                          max_retries=Retry(total=2, backoff_factor=0.1)))
+    return session
 
 
 def check_ollama():
     """Check if Ollama is running"""
-    import requests
     try:
         ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-        response = requests.get(f"{ollama_url}/api/tags", timeout=5)
+        response = _http_session().get(f"{ollama_url}/api/tags", timeout=5)
         if response.status_code == 200:
             models = response.json().get("models", [])
             return True, [m["name"] for m in models]
@@ -104,18 +154,9 @@ def main():
     
     # Main menu
     while True:
-        print(f"\n{Colors.BOLD}{'─'*60}{Colors.END}")
-        print(f"{Colors.BOLD}主菜单 / Main Menu:{Colors.END}")
-        print("  1. 📄 加载 PDF 文档 (Load PDF)")
-        print("  2. 📁 加载文件夹 (Load Directory)")
-        print("  3. ❓ 提问 (Ask Question)")
-        print("  4. 🔍 搜索相关内容 (Search)")
-        print("  5. 📊 查看状态 (Status)")
-        print("  6. 🗑️  清除数据库 (Clear Database)")
-        print("  7. 👋 退出 (Exit)")
-        print(f"{Colors.BOLD}{'─'*60}{Colors.END}")
+        _write(_MENU_STR)
         
-        choice = input(f"\n{Colors.GREEN}请选择 (1-7): {Colors.END}").strip()
+        choice = input(_CHOICE_PROMPT).strip()
         
         if choice == "1":
             # Load single PDF
@@ -161,8 +202,11 @@ def main():
             
             print(f"\n{Colors.CYAN}进入问答模式 (输入 'exit' 返回菜单){Colors.END}")
             
+            # File names of sources, parsed once per source rather than per answer
+            source_names = {}
+            
             while True:
-                question = input(f"\n{Colors.GREEN}问题: {Colors.END}").strip()
+                question = input(_QUESTION_PROMPT).strip()
                 
                 if question.lower() in ['exit', 'quit', 'q', '退出']:
                     break
@@ -173,8 +217,8 @@ def main():
                 try:
                     result = rag.query(question)
                     
-                    print(f"\n{Colors.BOLD}{Colors.CYAN}回答:{Colors.END}")
-                    print(f"{result['answer']}")
+                    _write(_ANSWER_HEADER)
+                    print(result['answer'])
                     
                     # Show sources
                     if result['source_documents']:
@@ -182,8 +226,11 @@ def main():
                         for i, doc in enumerate(result['source_documents'][:3], 1):
                             source = doc.metadata.get('source', 'Unknown')
                             page = doc.metadata.get('page', '?')
-                            snippet = doc.page_content[:100].replace('\n', ' ')
-                            print(f"  {Colors.DIM}[{i}] {Path(source).name}, p.{page}: {snippet}...{Colors.END}")
+                            name = source_names.get(source)
+                            if name is None:
+                                name = source_names[source] = Path(source).name
+                            snippet = doc.page_content[:100].translate(_SNIPPET_TABLE)
+                            print(f"  {Colors.DIM}[{i}] {name}, p.{page}: {snippet}...{Colors.END}")
                 
                 except Exception as e:
                     print_error(f"查询失败: {e}")
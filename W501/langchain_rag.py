@@ -11,31 +11,366 @@ Features:
 """
 
 import os
-import pickle
-from typing import List, Optional, Dict, Any
+import json
+import hashlib
+import asyncio
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import List, Optional, Dict, Any, Iterable, Iterator
 from pathlib import Path
 
 # LangChain imports
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_community.vectorstores import FAISS
-from langchain_core.prompts import ChatPromptTemplate
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 
 # For embeddings and LLM
 from langchain_ollama import OllamaEmbeddings, OllamaLLM
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 
+import faiss
+import fitz
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+# Optional Rust splitter, used instead of RecursiveCharacterTextSplitter when installed
+try:
+    from semantic_text_splitter import TextSplitter as RustTextSplitter
+except ImportError:
+    RustTextSplitter = None
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Let FAISS spread batched searches over every core (OpenMP)
+faiss.omp_set_num_threads(int(os.getenv("FAISS_THREADS", os.cpu_count() or 1)))
+
+# HNSW graph parameters: neighbours per node, build-time and query-time search breadth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Chunks taken from a document stream per add step; also the sample an
+# untrained (IVF/PQ/SQ) index is trained on
+INGEST_BATCH_SIZE = 2048
+# JSON sidecar holding the documents, index-to-id mapping and document count
+STORE_FILE = "docstore.json"
+# Chunks embedded per request when adding documents
+EMBED_BATCH_SIZE = 64
+# Scalar quantizer used when quantize_vectors is set:
+# "8bit" (4x smaller, ~1% recall loss) or "fp16" (2x smaller, near-lossless)
+SQ_TYPE = os.getenv("FAISS_SQ_TYPE", "8bit")
+# How long Ollama keeps the model, and with it the cached prompt prefix, loaded
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Speculative drafting: after the draft model answers, how long the full model
+# may still take before the draft is returned instead; chunks given to the draft
+DRAFT_GRACE_SECONDS = 2.0
+DRAFT_CONTEXT_DOCS = 2
+# Query strings whose embeddings are kept in memory (exact-text LRU)
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+# Binary prefilter: Hamming-distance candidates per requested result, reranked exactly
+BINARY_CANDIDATES_FACTOR = 8
+# Semantic query cache (opt-in): suggested cosine similarity at which a new
+# question reuses a cached answer; oldest half dropped when full
+QUERY_CACHE_THRESHOLD = 0.95
+QUERY_CACHE_SIZE = 1000
+# Inverted lists probed per query when an IVF index is chosen via index_factory
+IVF_NPROBE = 16
+
+
+def _set_search_params(index):
+    """Apply query-time search breadth (efSearch for HNSW, nprobe for IVF)"""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return
+    try:
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+    except RuntimeError:
+        pass  # not an IVF index (e.g. flat)
+
+
+def _chunk_key(doc: Document) -> str:
+    return hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# Answer prompt, rendered with str.format instead of a ChatPromptTemplate
+ANSWER_PROMPT = """使用以下检索到的上下文来回答问题。如果你不知道答案，就说你不知道，不要试图编造答案。
+请用中文回答，并尽可能详细和准确。
+
+上下文信息:
+{context}
+
+问题: {question}
+
+回答:"""
+
+
+def _build_prompt(inputs: Dict[str, str]) -> str:
+    """Fill ANSWER_PROMPT; both the Ollama and chat models accept a plain string"""
+    return ANSWER_PROMPT.format(context=inputs["context"], question=inputs["question"])
+
+
+def _binary_codes(vectors) -> np.ndarray:
+    """Pack the sign of each dimension into bits (32x smaller than float32)"""
+    return np.packbits(np.asarray(vectors, dtype=np.float32) > 0, axis=1)
+
 
 def format_docs(docs: List[Document]) -> str:
-    """Format documents into a single string for context"""
-    return "\n\n".join(doc.page_content for doc in docs)
+    """
+    Format documents into a single string for context
+    
+    Chunks stay in retrieval rank order, so the most relevant one comes first.
+    """
+    # A list (not a generator) lets join size the result in one pass
+    return "\n\n".join([doc.page_content for doc in docs])
+
+
+class _ReadWriteLock:
+    """
+    Lock admitting many readers or a single writer
+    
+    Waiting writers block new readers, so a steady stream of searches can't
+    starve an ingest.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class SemanticQueryCache:
+    """
+    Cache of answers keyed by question embedding
+    
+    Lookups are an exact inner-product search over normalized past question
+    vectors, so paraphrases of an answered question skip retrieval and the LLM.
+    Questions differing only in an entity or a year can land above the
+    threshold too, which is why the cache is opt-in. put() only updates memory;
+    save() writes the cache to disk as <path>.npy (question vectors) and
+    <path>.json (answers and source documents).
+    """
+    
+    def __init__(self, path: str, threshold: float = QUERY_CACHE_THRESHOLD, max_size: int = QUERY_CACHE_SIZE):
+        self.path = path
+        self._vectors_file = path + ".npy"
+        self._results_file = path + ".json"
+        self.threshold = threshold
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._index = None
+        self._results: List[Dict[str, Any]] = []
+        self._dirty = False
+        self._load()
+    
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        vectors = np.array(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        faiss.normalize_L2(vectors)
+        return vectors
+    
+    def _rebuild(self, vectors: np.ndarray):
+        self._index = faiss.IndexFlatIP(vectors.shape[1])
+        self._index.add(vectors)
+    
+    def _load(self):
+        if not (os.path.exists(self._vectors_file) and os.path.exists(self._results_file)):
+            return
+        try:
+            vectors = np.load(self._vectors_file)
+            with open(self._results_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            # A save interrupted between the two files leaves them out of step
+            if entries and len(entries) == len(vectors):
+                self._rebuild(vectors)
+                self._results = [
+                    {
+                        "answer": entry["answer"],
+                        "source_documents": [
+                            Document(page_content=text, metadata=metadata)
+                            for text, metadata in entry["source_documents"]
+                        ]
+                    }
+                    for entry in entries
+                ]
+        except Exception as e:
+            print(f"⚠ Could not load query cache: {e}")
+    
+    def save(self):
+        """Write the cache to disk if it changed since the last save"""
+        with self._lock:
+            if not self._dirty or self._index is None:
+                return
+            vectors = self._index.reconstruct_n(0, self._index.ntotal)
+            results = list(self._results)
+            self._dirty = False
+        entries = [
+            {
+                "answer": result["answer"],
+                "source_documents": [[doc.page_content, doc.metadata] for doc in result["source_documents"]]
+            }
+            for result in results
+        ]
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self._vectors_file + ".tmp", "wb") as f:
+                np.save(f, vectors)
+            with open(self._results_file + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, default=str)
+            os.replace(self._vectors_file + ".tmp", self._vectors_file)
+            os.replace(self._results_file + ".tmp", self._results_file)
+            # A pickle from the old format would otherwise go stale next to the new files
+            if os.path.exists(self.path + ".pkl"):
+                os.remove(self.path + ".pkl")
+        except Exception as e:
+            print(f"⚠ Could not save query cache: {e}")
+    
+    def get(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Return the cached result for a sufficiently similar question, or None"""
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(self._normalize([embedding]), 1)
+            if scores[0][0] >= self.threshold:
+                return self._results[ids[0][0]]
+            return None
+    
+    def put(self, embedding: List[float], result: Dict[str, Any]):
+        """Cache a result in memory"""
+        with self._lock:
+            vector = self._normalize([embedding])
+            if self._index is None:
+                self._rebuild(vector)
+                self._results = [result]
+            else:
+                if self._index.ntotal >= self.max_size:
+                    keep = self._index.ntotal // 2
+                    self._rebuild(self._index.reconstruct_n(self._index.ntotal - keep, keep))
+                    self._results = self._results[-keep:]
+                self._index.add(vector)
+                self._results.append(result)
+            self._dirty = True
+    
+    def clear(self):
+        """Drop every cached answer (e.g. after the document set changes)"""
+        with self._lock:
+            self._index = None
+            self._results = []
+            self._dirty = False
+            for cache_file in (self._vectors_file, self._results_file, self.path + ".pkl"):
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """
+    Embeddings that memoize query vectors in an in-memory LRU
+    
+    Documents go to one embedder (typically the disk-cached one) and queries to
+    another, so repeated questions or searches skip the embedding round-trip
+    wherever they are embedded: query(), the retriever, or similarity search.
+    """
+    
+    def __init__(self, documents: Embeddings, queries: Embeddings, maxsize: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.documents = documents
+        self.queries = queries
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _get(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._cache.get(text)
+            if embedding is not None:
+                self._cache.move_to_end(text)
+            return embedding
+    
+    def _put(self, text: str, embedding: List[float]):
+        with self._lock:
+            self._cache[text] = embedding
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.documents.embed_documents(texts)
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.documents.aembed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        embedding = self._get(text)
+        if embedding is None:
+            embedding = self.queries.embed_query(text)
+            self._put(text, embedding)
+        return list(embedding)
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        embedding = self._get(text)
+        if embedding is None:
+            embedding = await self.queries.aembed_query(text)
+            self._put(text, embedding)
+        return list(embedding)
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, sending only uncached distinct ones in one request"""
+        found = {text: self._get(text) for text in texts}
+        misses = [text for text, embedding in found.items() if embedding is None]
+        if misses:
+            for text, embedding in zip(misses, self.queries.embed_documents(misses)):
+                found[text] = embedding
+                self._put(text, embedding)
+        return [list(found[text]) for text in texts]
+    
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, sending only uncached distinct ones in one request"""
+        found = {text: self._get(text) for text in texts}
+        misses = [text for text, embedding in found.items() if embedding is None]
+        if misses:
+            for text, embedding in zip(misses, await self.queries.aembed_documents(misses)):
+                found[text] = embedding
+                self._put(text, embedding)
+        return [list(found[text]) for text in texts]
 
 
 class LangChainRAG:
@@ -52,7 +387,15 @@ class LangChainRAG:
         use_ollama: bool = True,
         ollama_model: str = "llama3.2",
         embedding_model: str = "nomic-embed-text",
-        openai_model: str = "gpt-3.5-turbo"
+        openai_model: str = "gpt-3.5-turbo",
+        embedding_cache_dir: Optional[str] = "./.emb_cache",
+        quantize_vectors: bool = False,
+        mmap_index: bool = False,
+        index_factory: Optional[str] = None,
+        query_cache_threshold: Optional[float] = None,
+        warmup: bool = True,
+        draft_model: Optional[str] = None,
+        binary_prefilter: bool = False
     ):
         """
         Initialize the RAG system
@@ -65,12 +408,48 @@ class LangChainRAG:
             ollama_model: Ollama model name for LLM
             embedding_model: Model name for embeddings
             openai_model: OpenAI model name (if use_ollama=False)
+            embedding_cache_dir: Directory caching chunk embeddings across ingests (None to disable)
+            quantize_vectors: Store new indexes as 8-bit scalar-quantized vectors (4x smaller)
+            mmap_index: Memory-map a persisted index read-only instead of reading it into RAM
+            index_factory: FAISS index_factory string for new indexes (e.g. "HNSW32,Flat",
+                           "IVF1024,PQ32"); overrides quantize_vectors. IVF/PQ indexes are
+                           trained on the first batch, which needs enough chunks for the lists
+            query_cache_threshold: Cosine similarity at which a past answer is reused
+                                   for a new question, e.g. QUERY_CACHE_THRESHOLD
+                                   (None, the default, disables the cache)
+            warmup: Load the Ollama models in the background so the first
+                    ingest/query doesn't wait for them
+            draft_model: Small Ollama model (e.g. "llama3.2:1b") that drafts an answer
+                         from the top chunks in aquery while the main model runs;
+                         the draft is returned only if the main model is much slower
+            binary_prefilter: Keep a 1-bit-per-dimension copy of the vectors and answer
+                              similarity_search by Hamming prefilter + exact rerank
         """
         self.persist_directory = persist_directory
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.use_ollama = use_ollama
+        self.quantize_vectors = quantize_vectors
+        self.mmap_index = mmap_index
+        self.index_factory = index_factory
+        self.binary_prefilter = binary_prefilter
+        self._binary_index = None
+        self._index_is_mmapped = False
         self._document_count = 0
+        # Content hashes of stored chunks, so repeated chunks are never embedded twice
+        self._chunk_hashes = set()
+        
+        # Saves run on one background thread; _store_lock keeps a save from
+        # reading the index while a batch is being added
+        self._store_lock = threading.RLock()
+        # FAISS can't search while vectors are added, and LangChain fills in the
+        # id mapping after index.add; searches read under this lock, adds and
+        # clears write under it
+        self._index_lock = _ReadWriteLock()
+        self._save_executor = ThreadPoolExecutor(max_workers=1)
+        self._save_future = None
+        self._save_pending = False
+        atexit.register(self.flush)
         
         # Initialize text splitter
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -79,20 +458,34 @@ class LangChainRAG:
             length_function=len,
             separators=["\n\n", "\n", "。", ".", " ", ""]
         )
+        # Same character budget, split natively (paragraphs, lines, sentences, words)
+        if RustTextSplitter is not None:
+            self._split_text = RustTextSplitter(chunk_size, overlap=chunk_overlap).chunks
+        else:
+            self._split_text = self.text_splitter.split_text
         
         # Initialize embeddings
         if use_ollama:
-            self.embeddings = OllamaEmbeddings(
+            embeddings = OllamaEmbeddings(
                 model=embedding_model,
                 base_url=os.getenv("OLLAMA_URL", "http://localhost:11434")
             )
             self.llm = OllamaLLM(
                 model=ollama_model,
                 base_url=os.getenv("OLLAMA_URL", "http://localhost:11434"),
-                temperature=0.7
+                temperature=0.7,
+                keep_alive=OLLAMA_KEEP_ALIVE
             )
+            self.draft_llm = None
+            if draft_model:
+                self.draft_llm = OllamaLLM(
+                    model=draft_model,
+                    base_url=os.getenv("OLLAMA_URL", "http://localhost:11434"),
+                    temperature=0.7,
+                    keep_alive=OLLAMA_KEEP_ALIVE
+                )
         else:
-            self.embeddings = OpenAIEmbeddings(
+            embeddings = OpenAIEmbeddings(
                 openai_api_key=os.getenv("OPENAI_API_KEY"),
                 openai_api_base=os.getenv("OPENAI_BASE_URL")
             )
@@ -102,77 +495,268 @@ class LangChainRAG:
                 openai_api_base=os.getenv("OPENAI_BASE_URL"),
                 temperature=0.7
             )
+            self.draft_llm = None
+        
+        # Cache chunk embeddings on disk, keyed by text hash, so re-ingesting a PDF
+        # only embeds chunks that changed. Namespaced by model so vectors never mix.
+        # Queries skip the disk cache, so one-off questions don't fill it; instead
+        # recent query vectors are kept in memory
+        self._query_embeddings = embeddings
+        document_embeddings = embeddings
+        if embedding_cache_dir:
+            document_embeddings = CacheBackedEmbeddings.from_bytes_store(
+                embeddings,
+                LocalFileStore(embedding_cache_dir),
+                namespace=embeddings.model
+            )
+        self.embeddings = QueryCachedEmbeddings(document_embeddings, embeddings)
         
         # Vector store (will be initialized when documents are loaded)
         self.vectorstore: Optional[FAISS] = None
         self.rag_chain = None
         
+        # Answers to earlier questions, reused for near-duplicate questions
+        self.query_cache = None
+        if query_cache_threshold is not None:
+            self.query_cache = SemanticQueryCache(
+                os.path.join(persist_directory, "query_cache"),
+                threshold=query_cache_threshold
+            )
+        
         # Try to load existing vector store
         self._load_existing_vectorstore()
+        
+        if warmup and use_ollama:
+            threading.Thread(target=self._warmup, daemon=True).start()
+    
+    def _warmup(self):
+        """Send tiny requests so Ollama loads both models while the caller sets up"""
+        try:
+            self._query_embeddings.embed_query("warmup")
+            self.llm.invoke("ok")
+            if self.draft_llm is not None:
+                self.draft_llm.invoke("ok")
+        except Exception as e:
+            print(f"⚠ Model warm-up failed: {e}")
     
     def _load_existing_vectorstore(self):
         """Load existing vector store if available"""
         index_path = os.path.join(self.persist_directory, "index.faiss")
         if os.path.exists(index_path):
             try:
-                self.vectorstore = FAISS.load_local(
-                    self.persist_directory,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                # Load document count
-                count_file = os.path.join(self.persist_directory, "doc_count.pkl")
-                if os.path.exists(count_file):
-                    with open(count_file, "rb") as f:
-                        self._document_count = pickle.load(f)
+                index = self._read_index(index_path)
+                store_file = os.path.join(self.persist_directory, STORE_FILE)
+                if os.path.exists(store_file):
+                    docstore, index_to_docstore_id, self._document_count = self._read_store(store_file)
+                else:
+                    docstore, index_to_docstore_id = self._read_legacy_store()
+                
+                self.vectorstore = self._wrap_index(index, docstore, index_to_docstore_id)
+                self._chunk_hashes = {
+                    _chunk_key(docstore.search(doc_id)) for doc_id in index_to_docstore_id.values()
+                }
+                # Search breadth isn't guaranteed to survive a save/load round-trip
+                _set_search_params(self.vectorstore.index)
+                if self.binary_prefilter:
+                    self._build_binary_index()
                 self._setup_rag_chain()
                 print(f"✓ Loaded existing vector store from {self.persist_directory}")
             except Exception as e:
                 print(f"⚠ Could not load existing vector store: {e}")
     
+    def _read_index(self, index_path: str):
+        """
+        Read the persisted FAISS index
+        
+        With mmap_index the file is mapped read-only: pages are read from disk on
+        demand and shared through the page cache, so several workers serving the
+        same index don't each hold a copy. Falls back to a normal read for index
+        types FAISS can't map.
+        """
+        if self.mmap_index:
+            try:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                self._index_is_mmapped = True
+                return index
+            except RuntimeError as e:
+                print(f"⚠ Could not memory-map index, reading it into memory: {e}")
+        return faiss.read_index(index_path)
+    
+    @staticmethod
+    def _read_store(store_file: str):
+        """Read documents, id mapping and document count from the JSON sidecar"""
+        with open(store_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        docstore = InMemoryDocstore({
+            doc_id: Document(page_content=text, metadata=metadata)
+            for doc_id, text, metadata in data["documents"]
+        })
+        index_to_docstore_id = dict(enumerate(data["ids"]))
+        return docstore, index_to_docstore_id, data["count"]
+    
+    def _read_legacy_store(self):
+        """Read a store saved by FAISS.save_local (pickled docstore, pickled count)"""
+        import pickle
+        with open(os.path.join(self.persist_directory, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        count_file = os.path.join(self.persist_directory, "doc_count.pkl")
+        if os.path.exists(count_file):
+            with open(count_file, "rb") as f:
+                self._document_count = pickle.load(f)
+        return docstore, index_to_docstore_id
+    
+    def _wrap_index(self, index, docstore, index_to_docstore_id) -> FAISS:
+        """
+        Wrap a FAISS index in a LangChain vector store
+        
+        Inner-product indexes hold unit vectors: LangChain normalizes vectors on
+        add and queries on search. Older L2 stores keep their original behaviour.
+        """
+        inner_product = index.metric_type == faiss.METRIC_INNER_PRODUCT
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+            normalize_L2=inner_product,
+            distance_strategy=(DistanceStrategy.MAX_INNER_PRODUCT if inner_product
+                               else DistanceStrategy.EUCLIDEAN_DISTANCE)
+        )
+    
+    def _new_index(self, vectors: List[List[float]]):
+        """
+        Create an HNSW index: approximate search that visits O(log N) vectors per
+        query instead of scanning all of them like LangChain's default IndexFlatL2
+        
+        Args:
+            vectors: The first batch of embeddings, used to train the quantizer
+        """
+        dim = len(vectors[0])
+        # Vectors are unit-normalized, so inner product ranks exactly like cosine
+        # (and like L2) without the subtraction per dimension
+        metric = faiss.METRIC_INNER_PRODUCT
+        if self.index_factory:
+            index = faiss.index_factory(dim, self.index_factory, metric)
+        elif self.quantize_vectors:
+            # Smaller codes cut the bytes read per distance computation (queries stay
+            # float32); 8-bit value ranges are learned from the first batch
+            qtype = getattr(faiss.ScalarQuantizer, f"QT_{SQ_TYPE}")
+            index = faiss.IndexHNSWSQ(dim, qtype, HNSW_M, metric)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+        
+        if not index.is_trained:
+            sample = np.array(vectors, dtype=np.float32)
+            faiss.normalize_L2(sample)
+            index.train(sample)
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        _set_search_params(index)
+        return index
+    
+    def _schedule_save(self):
+        """Save in the background; requests made while one is queued share it"""
+        with self._store_lock:
+            if self._save_pending:
+                return
+            self._save_pending = True
+            self._save_future = self._save_executor.submit(self._background_save)
+    
+    def _background_save(self):
+        with self._store_lock:
+            self._save_pending = False
+            try:
+                self._save_vectorstore()
+            except Exception as e:
+                print(f"⚠ Could not save vector store: {e}")
+        if self.query_cache is not None:
+            self.query_cache.save()
+    
+    def flush(self):
+        """Wait until pending background saves have been written to disk"""
+        future = self._save_future
+        if future is not None:
+            future.result()
+        # Answers cached since the last save are only written here or alongside the store
+        if self.query_cache is not None:
+            self.query_cache.save()
+    
     def _save_vectorstore(self):
         """Save vector store to disk"""
         if self.vectorstore is not None:
             os.makedirs(self.persist_directory, exist_ok=True)
-            self.vectorstore.save_local(self.persist_directory)
-            # Save document count
-            count_file = os.path.join(self.persist_directory, "doc_count.pkl")
-            with open(count_file, "wb") as f:
-                pickle.dump(self._document_count, f)
+            faiss.write_index(self.vectorstore.index, os.path.join(self.persist_directory, "index.faiss"))
+            
+            # Documents, id mapping and count go to a JSON sidecar instead of pickles
+            index_to_docstore_id = self.vectorstore.index_to_docstore_id
+            ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+            documents = []
+            for doc_id in ids:
+                doc = self.vectorstore.docstore.search(doc_id)
+                documents.append([doc_id, doc.page_content, doc.metadata])
+            
+            store_file = os.path.join(self.persist_directory, STORE_FILE)
+            with open(store_file + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"count": self._document_count, "ids": ids, "documents": documents},
+                          f, ensure_ascii=False, default=str)
+            os.replace(store_file + ".tmp", store_file)
+            
+            # Pickles from the old format would otherwise go stale next to the new files
+            for legacy in ("index.pkl", "doc_count.pkl"):
+                legacy_path = os.path.join(self.persist_directory, legacy)
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
     
     def _setup_rag_chain(self):
         """Set up the RAG chain using LCEL (LangChain Expression Language)"""
         if self.vectorstore is None:
             return
         
-        # Custom prompt template for better answers
-        prompt = ChatPromptTemplate.from_template("""使用以下检索到的上下文来回答问题。如果你不知道答案，就说你不知道，不要试图编造答案。
-请用中文回答，并尽可能详细和准确。
-
-上下文信息:
-{context}
-
-问题: {question}
-
-回答:""")
+        # Custom prompt for better answers, filled by a plain str.format
+        prompt = RunnableLambda(_build_prompt)
         
-        # Create retriever
-        retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 4}  # Return top 4 relevant chunks
-        )
+        # Create retriever (top 4 relevant chunks, searched under the index lock)
+        retriever = RunnableLambda(self._retrieve, afunc=self._aretrieve)
+        
+        # Answer generation from already retrieved context
+        self._answer_chain = prompt | self.llm | StrOutputParser()
+        self._draft_chain = None
+        if self.draft_llm is not None:
+            self._draft_chain = prompt | self.draft_llm | StrOutputParser()
         
-        # Create RAG chain using LCEL
+        # Create RAG chain using LCEL: retrieve once, then answer from those
+        # documents and return them with the answer
         self.rag_chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | StrOutputParser()
+            RunnableParallel(docs=retriever, question=RunnablePassthrough())
+            | RunnablePassthrough.assign(
+                answer=(lambda x: {"context": format_docs(x["docs"]), "question": x["question"]})
+                | self._answer_chain
+            )
         )
         
         # Store retriever for later use
         self._retriever = retriever
     
+    def _split_pdf(self, pdf, source: str) -> List[Document]:
+        """
+        Split an open fitz document page by page into chunk Documents
+        
+        Text is taken from fitz directly and only the chunks become Documents,
+        with the same metadata PyMuPDFLoader would attach to their page.
+        """
+        base_metadata = {
+            **(pdf.metadata or {}),
+            "source": source,
+            "file_path": source,
+            "total_pages": pdf.page_count,
+        }
+        chunks = []
+        for page in pdf:
+            page_metadata = {**base_metadata, "page": page.number}
+            for text in self._split_text(page.get_text()):
+                chunks.append(Document(page_content=text, metadata=dict(page_metadata)))
+        return chunks
+    
     def load_pdf(self, pdf_path: str) -> List[Document]:
         """
         Load a PDF file and split into chunks
@@ -188,37 +772,81 @@ class LangChainRAG:
         
         print(f"📄 Loading PDF: {pdf_path}")
         
-        # Load PDF using PyMuPDF
-        loader = PyMuPDFLoader(pdf_path)
-        documents = loader.load()
+        with fitz.open(pdf_path) as pdf:
+            print(f"   Loaded {pdf.page_count} pages")
+            chunks = self._split_pdf(pdf, pdf_path)
+        print(f"   Split into {len(chunks)} chunks")
         
-        print(f"   Loaded {len(documents)} pages")
+        return chunks
+    
+    def load_pdf_bytes(self, data: bytes, source: str) -> List[Document]:
+        """
+        Load an in-memory PDF and split into chunks
+        
+        Args:
+            data: Raw PDF bytes (e.g. an uploaded file)
+            source: Name recorded as the document source
+            
+        Returns:
+            List of Document objects
+        """
+        print(f"📄 Loading PDF: {source}")
         
-        # Split into chunks
-        chunks = self.text_splitter.split_documents(documents)
+        # Open straight from memory
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            print(f"   Loaded {pdf.page_count} pages")
+            chunks = self._split_pdf(pdf, source)
         print(f"   Split into {len(chunks)} chunks")
         
         return chunks
     
-    def load_multiple_pdfs(self, pdf_paths: List[str]) -> List[Document]:
+    def iter_pdf_chunks(self, pdf_paths: List[str]) -> Iterator[Document]:
         """
-        Load multiple PDF files
+        Load PDF files and yield their chunks, file by file
         
         Args:
             pdf_paths: List of PDF file paths
             
-        Returns:
-            List of all Document chunks
+        Yields:
+            Document chunks, in input order
         """
-        all_chunks = []
-        for pdf_path in pdf_paths:
+        def load_one(pdf_path: str) -> List[Document]:
             try:
-                chunks = self.load_pdf(pdf_path)
-                all_chunks.extend(chunks)
+                return self.load_pdf(pdf_path)
             except Exception as e:
                 print(f"⚠ Error loading {pdf_path}: {e}")
+                return []
+        
+        if len(pdf_paths) <= 1:
+            for pdf_path in pdf_paths:
+                yield from load_one(pdf_path)
+            return
+        
+        # PyMuPDF releases the GIL while parsing, so threads overlap the file
+        # reads and parsing. Only one file per worker is loaded ahead of the
+        # consumer, so memory holds a few files' chunks rather than the corpus.
+        workers = min(len(pdf_paths), os.cpu_count() or 1)
+        paths = iter(pdf_paths)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque(executor.submit(load_one, path) for path in islice(paths, workers))
+            while pending:
+                chunks = pending.popleft().result()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.append(executor.submit(load_one, next_path))
+                yield from chunks
+    
+    def load_multiple_pdfs(self, pdf_paths: List[str]) -> List[Document]:
+        """
+        Load multiple PDF files
         
-        return all_chunks
+        Args:
+            pdf_paths: List of PDF file paths
+            
+        Returns:
+            List of all Document chunks
+        """
+        return list(self.iter_pdf_chunks(pdf_paths))
     
     def load_directory(self, directory: str) -> List[Document]:
         """
@@ -235,38 +863,91 @@ class LangChainRAG:
         
         return self.load_multiple_pdfs([str(f) for f in pdf_files])
     
-    def add_documents(self, documents: List[Document]):
+    def add_documents(self, documents: Iterable[Document]):
         """
         Add documents to the vector store
         
+        The documents may be a generator; they are consumed INGEST_BATCH_SIZE
+        chunks at a time, so the whole corpus never has to be in memory.
+        
         Args:
-            documents: List of Document objects to add
+            documents: Document objects to add
         """
-        if not documents:
-            print("⚠ No documents to add")
+        added = 0
+        iterator = iter(documents)
+        while batch := list(islice(iterator, INGEST_BATCH_SIZE)):
+            added += self._add_batch(batch)
+        
+        if added == 0:
+            print("⚠ No new documents to add")
             return
         
-        print(f"📥 Adding {len(documents)} documents to vector store...")
+        with self._store_lock:
+            self._document_count += added
         
-        if self.vectorstore is None:
-            # Create new vector store
-            self.vectorstore = FAISS.from_documents(
-                documents=documents,
-                embedding=self.embeddings
-            )
-        else:
-            # Add to existing vector store
-            self.vectorstore.add_documents(documents)
-        
-        self._document_count += len(documents)
+        # Cached answers may be missing the new content
+        if self.query_cache is not None:
+            self.query_cache.clear()
         
-        # Persist the vector store
-        self._save_vectorstore()
+        # Persist the vector store without making the caller wait for the disk
+        self._schedule_save()
         
         # Setup RAG chain
         self._setup_rag_chain()
         
-        print(f"✓ Documents added and persisted to {self.persist_directory}")
+        print(f"✓ Documents added; saving to {self.persist_directory} in the background")
+    
+    def _add_batch(self, documents: List[Document]) -> int:
+        """
+        Embed and index one batch of documents
+        
+        Returns:
+            Number of documents added
+        """
+        # Drop chunks whose exact text is already stored or repeated in this batch
+        # (page headers/footers, re-ingested files)
+        unique, new_hashes = [], set()
+        for doc in documents:
+            key = _chunk_key(doc)
+            if key not in self._chunk_hashes and key not in new_hashes:
+                new_hashes.add(key)
+                unique.append(doc)
+        if len(unique) < len(documents):
+            print(f"   Skipped {len(documents) - len(unique)} duplicate chunks")
+        documents = unique
+        if not documents:
+            return 0
+        
+        print(f"📥 Adding {len(documents)} documents to vector store...")
+        
+        # Embed up front in fixed-size batches: one request per batch, and
+        # the vectors are reused to build/train the index
+        texts = [doc.page_content for doc in documents]
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+        
+        with self._store_lock, self._index_lock.write():
+            if self.vectorstore is None:
+                # Create new vector store on an HNSW graph index
+                self.vectorstore = self._wrap_index(self._new_index(vectors), InMemoryDocstore(), {})
+            elif self._index_is_mmapped:
+                # A read-only mapping can't grow; switch to an in-memory copy first
+                index_path = os.path.join(self.persist_directory, "index.faiss")
+                self.vectorstore.index = faiss.read_index(index_path)
+                self._index_is_mmapped = False
+            
+            self.vectorstore.add_embeddings(
+                zip(texts, vectors),
+                metadatas=[doc.metadata for doc in documents]
+            )
+            self._chunk_hashes |= new_hashes
+            if self.binary_prefilter:
+                if self._binary_index is None:
+                    self._build_binary_index()
+                else:
+                    self._binary_index.add(_binary_codes(vectors))
+        return len(documents)
     
     def ingest_pdf(self, pdf_path: str):
         """
@@ -285,8 +966,11 @@ class LangChainRAG:
         Args:
             directory: Path to directory containing PDFs
         """
-        chunks = self.load_directory(directory)
-        self.add_documents(chunks)
+        pdf_files = [str(f) for f in Path(directory).glob("*.pdf")]
+        print(f"📁 Found {len(pdf_files)} PDF files in {directory}")
+        
+        # Chunks stream from the loaders straight into batched embedding
+        self.add_documents(self.iter_pdf_chunks(pdf_files))
     
     def query(self, question: str) -> Dict[str, Any]:
         """
@@ -306,16 +990,176 @@ class LangChainRAG:
         
         print(f"🔍 Searching for: {question}")
         
-        # Get the answer
-        answer = self.rag_chain.invoke(question)
+        if self.query_cache is None:
+            # One chain run retrieves the sources and answers from them
+            result = self.rag_chain.invoke(question)
+            return {
+                "answer": result["answer"],
+                "source_documents": result["docs"]
+            }
         
-        # Get source documents separately
-        source_docs = self._retriever.invoke(question)
+        # Embed once: the vector serves both the cache lookup and retrieval
+        embedding = self.embeddings.embed_query(question)
+        cached = self.query_cache.get(embedding)
+        if cached is not None:
+            return cached
         
-        return {
+        source_docs = self._search_by_vector(embedding, 4)
+        answer = self._answer_chain.invoke({
+            "context": format_docs(source_docs),
+            "question": question
+        })
+        
+        result = {
             "answer": answer,
             "source_documents": source_docs
         }
+        self.query_cache.put(embedding, result)
+        return result
+    
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several queries in one request
+        
+        Args:
+            queries: Questions or search queries
+            
+        Returns:
+            One embedding per query
+        """
+        return await self.embeddings.aembed_queries(queries)
+    
+    async def aquery(self, question: str, embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Async version of query
+        
+        Args:
+            question: The question to ask
+            embedding: Precomputed question embedding (e.g. from aembed_queries)
+            
+        Returns:
+            Dictionary with 'answer' and 'source_documents'
+        """
+        if self.rag_chain is None:
+            return {
+                "answer": "⚠ 请先加载文档。使用 ingest_pdf() 或 ingest_directory() 方法加载PDF文档。",
+                "source_documents": []
+            }
+        
+        print(f"🔍 Searching for: {question}")
+        
+        if embedding is None:
+            if self.query_cache is None:
+                result = await self.rag_chain.ainvoke(question)
+                return {
+                    "answer": result["answer"],
+                    "source_documents": result["docs"]
+                }
+            embedding = await self.embeddings.aembed_query(question)
+        if self.query_cache is not None:
+            cached = self.query_cache.get(embedding)
+            if cached is not None:
+                return cached
+        
+        # Retrieve once with the embedding and answer from those sources
+        source_docs = await asyncio.to_thread(self._search_by_vector, embedding, 4)
+        answer, is_draft = await self._agenerate(question, source_docs)
+        
+        result = {
+            "answer": answer,
+            "source_documents": source_docs
+        }
+        # Drafts aren't cached, so a later paraphrase gets the full model's answer
+        if self.query_cache is not None and not is_draft:
+            self.query_cache.put(embedding, result)
+        return result
+    
+    async def _agenerate(self, question: str, source_docs: List[Document]):
+        """
+        Answer from retrieved documents, racing the draft model if configured
+        
+        The main model's answer wins whenever it arrives within
+        DRAFT_GRACE_SECONDS of the draft; otherwise the draft is returned.
+        
+        Returns:
+            (answer, whether the answer is a draft)
+        """
+        full = asyncio.ensure_future(self._answer_chain.ainvoke({
+            "context": format_docs(source_docs),
+            "question": question
+        }))
+        if self._draft_chain is None:
+            return await full, False
+        
+        draft = asyncio.ensure_future(self._draft_chain.ainvoke({
+            "context": format_docs(source_docs[:DRAFT_CONTEXT_DOCS]),
+            "question": question
+        }))
+        try:
+            await asyncio.wait({full, draft}, return_when=asyncio.FIRST_COMPLETED)
+            if not full.done() and draft.exception() is None:
+                await asyncio.wait({full}, timeout=DRAFT_GRACE_SECONDS)
+                if not full.done():
+                    return draft.result(), True
+            return await full, False
+        finally:
+            for task in (full, draft):
+                if not task.done():
+                    task.cancel()
+    
+    def _search_by_vector(self, embedding: List[float], k: int,
+                          use_prefilter: bool = False) -> List[Document]:
+        """Search the index under the read lock, so adds and clears can't interleave"""
+        with self._index_lock.read():
+            if self.vectorstore is None:
+                return []
+            if use_prefilter and self._binary_index is not None:
+                return self._binary_search(embedding, k)
+            return self.vectorstore.similarity_search_by_vector(embedding, k=k)
+    
+    def _retrieve(self, question: str) -> List[Document]:
+        return self._search_by_vector(self.embeddings.embed_query(question), 4)
+    
+    async def _aretrieve(self, question: str) -> List[Document]:
+        embedding = await self.embeddings.aembed_query(question)
+        return await asyncio.to_thread(self._search_by_vector, embedding, 4)
+    
+    def _build_binary_index(self):
+        """Build the binary prefilter from every vector in the store"""
+        index = self.vectorstore.index
+        if index.d % 8:
+            print(f"⚠ Binary prefilter needs a dimension divisible by 8 (got {index.d}); disabled")
+            self.binary_prefilter = False
+            return
+        try:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        except RuntimeError as e:
+            print(f"⚠ Binary prefilter unavailable for this index type: {e}")
+            self.binary_prefilter = False
+            return
+        self._binary_index = faiss.IndexBinaryFlat(index.d)
+        self._binary_index.add(_binary_codes(vectors))
+    
+    def _binary_search(self, embedding: List[float], k: int) -> List[Document]:
+        """
+        Search by Hamming distance over sign bits, then rerank the candidates
+        exactly against vectors reconstructed from the main index
+        
+        Callers hold the index read lock.
+        """
+        query = np.array([embedding], dtype=np.float32)
+        _, ids = self._binary_index.search(_binary_codes(query), k * BINARY_CANDIDATES_FACTOR)
+        ids = ids[0][ids[0] >= 0]
+        vectors = self.vectorstore.index.reconstruct_batch(ids)
+        
+        if self.vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            faiss.normalize_L2(query)
+            order = np.argsort(-(vectors @ query[0]))[:k]
+        else:
+            order = np.argsort(((vectors - query) ** 2).sum(axis=1))[:k]
+        
+        store = self.vectorstore
+        return [store.docstore.search(store.index_to_docstore_id[int(ids[i])]) for i in order]
     
     def similarity_search(self, query: str, k: int = 4) -> List[Document]:
         """
@@ -332,17 +1176,72 @@ class LangChainRAG:
             print("⚠ No documents loaded")
             return []
         
-        return self.vectorstore.similarity_search(query, k=k)
+        return self._search_by_vector(self.embeddings.embed_query(query), k, use_prefilter=True)
+    
+    def similarity_search_batch(self, queries: List[str], k: int = 4) -> List[List[Document]]:
+        """
+        Similarity search for several queries at once
+        
+        The queries are embedded in one request and searched with a single
+        index.search call on the stacked matrix, which FAISS splits across cores.
+        
+        Args:
+            queries: Search queries
+            k: Number of results per query
+            
+        Returns:
+            One list of relevant Document objects per query
+        """
+        if self.vectorstore is None:
+            print("⚠ No documents loaded")
+            return [[] for _ in queries]
+        if not queries:
+            return []
+        
+        matrix = np.array(self.embeddings.embed_queries(queries), dtype=np.float32)
+        with self._index_lock.read():
+            store = self.vectorstore
+            if store is None:
+                return [[] for _ in queries]
+            if store.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                faiss.normalize_L2(matrix)
+            _, ids = store.index.search(matrix, k)
+            
+            return [
+                [store.docstore.search(store.index_to_docstore_id[int(i)]) for i in row if i >= 0]
+                for row in ids
+            ]
+    
+    async def asimilarity_search(self, query: str, k: int = 4,
+                                 embedding: Optional[List[float]] = None) -> List[Document]:
+        """Async version of similarity_search, optionally with a precomputed query embedding"""
+        if self.vectorstore is None:
+            print("⚠ No documents loaded")
+            return []
+        
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(query)
+        return await asyncio.to_thread(self._search_by_vector, embedding, k, True)
     
     def clear_database(self):
         """Clear the vector database"""
         import shutil
-        if os.path.exists(self.persist_directory):
+        # A save finishing after the delete would recreate the files
+        self.flush()
+        # Wait for in-flight adds and searches before dropping the index
+        with self._store_lock, self._index_lock.write():
+            if not os.path.exists(self.persist_directory):
+                return
             shutil.rmtree(self.persist_directory)
             self.vectorstore = None
             self.rag_chain = None
+            self._index_is_mmapped = False
+            self._chunk_hashes = set()
+            self._binary_index = None
+            if self.query_cache is not None:
+                self.query_cache.clear()
             self._document_count = 0
-            print(f"✓ Cleared database at {self.persist_directory}")
+        print(f"✓ Cleared database at {self.persist_directory}")
     
     def get_document_count(self) -> int:
         """Get the number of documents in the vector store"""
@@ -352,7 +1251,13 @@ class LangChainRAG:
 def create_rag(
     use_ollama: bool = True,
     ollama_model: str = "llama3.2",
-    persist_directory: str = "./faiss_db"
+    persist_directory: str = "./faiss_db",
+    quantize_vectors: bool = False,
+    mmap_index: bool = False,
+    index_factory: Optional[str] = None,
+    draft_model: Optional[str] = None,
+    binary_prefilter: bool = False,
+    query_cache_threshold: Optional[float] = None
 ) -> LangChainRAG:
     """
     Factory function to create a RAG instance
@@ -361,6 +1266,7 @@ def create_rag(
         use_ollama: Whether to use Ollama (local) or OpenAI
         ollama_model: Ollama model name
         persist_directory: Where to store the vector database
+        quantize_vectors: Store new indexes as 8-bit scalar-quantized vectors
         
     Returns:
         Configured LangChainRAG instance
@@ -368,7 +1274,13 @@ def create_rag(
     return LangChainRAG(
         use_ollama=use_ollama,
         ollama_model=ollama_model,
-        persist_directory=persist_directory
+        persist_directory=persist_directory,
+        quantize_vectors=quantize_vectors,
+        mmap_index=mmap_index,
+        index_factory=index_factory,
+        draft_model=draft_model,
+        binary_prefilter=binary_prefilter,
+        query_cache_threshold=query_cache_threshold
     )
 
 
@@ -5,8 +5,11 @@ Natural language powered Excel data analysis
 import os
 import json
 import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Optional, Dict, Any
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException, Form
@@ -15,32 +18,57 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import pandas as pd
+import aiofiles
+
+# uvloop cuts per-frame overhead on the WebSocket endpoints; not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 import config
 from excel_processor import ExcelProcessor, KnowledgeBase
 from nlp_parser import NLPParser, AnalysisIntent, FileSelector
 from code_generator import CodeGenerator
-from code_executor import CodeExecutor, ResultFormatter
+from code_executor import ResultFormatter, execute_in_process
 from voice_handler import VoiceHandler, WebSocketVoiceSession
 
 
+# Upload read size; uploads are streamed to disk in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1 << 20
+
 # Global instances
 knowledge_base: KnowledgeBase = None
 nlp_parser: NLPParser = None
 code_generator: CodeGenerator = None
-code_executor: CodeExecutor = None
+code_pool: ProcessPoolExecutor = None
+
+# Caps concurrent analyses; bursts wait here instead of thrashing pandas/OpenAI
+ANALYZE_SEM = asyncio.Semaphore(config.ANALYZE_CONCURRENCY)
+analyze_waiting = 0
+analyze_running = 0
+
+# Processed sheets per file_id as (mtime_ns, {sheet_name: DataFrame}), oldest first
+SHEET_CACHE_SIZE = 32
+sheet_cache: "OrderedDict[str, tuple]" = OrderedDict()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
-    global knowledge_base, nlp_parser, code_generator, code_executor
+    global knowledge_base, nlp_parser, code_generator, code_pool
     
     # Initialize components
     knowledge_base = KnowledgeBase(str(config.KNOWLEDGE_BASE_DIR))
     nlp_parser = NLPParser()
     code_generator = CodeGenerator()
-    code_executor = CodeExecutor()
+    # Generated code runs in worker processes: it bypasses the GIL and keeps
+    # matplotlib and the SIGALRM timeout in each worker's main thread.
+    # "spawn" avoids forking a server process that already has threads.
+    code_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn")
+    )
     
     # Scan for existing files
     count = knowledge_base.scan_directory()
@@ -49,6 +77,7 @@ async def lifespan(app: FastAPI):
     yield
     
     # Cleanup
+    code_pool.shutdown(cancel_futures=True)
     print("Shutting down Excel Agent")
 
 
@@ -108,7 +137,13 @@ async def health_check():
     return {
         "status": "healthy",
         "files_loaded": len(knowledge_base.files) if knowledge_base else 0,
-        "openai_configured": bool(config.OPENAI_API_KEY)
+        "openai_configured": bool(config.OPENAI_API_KEY),
+        "analysis": {
+            "limit": config.ANALYZE_CONCURRENCY,
+            "running": analyze_running,
+            "queued": analyze_waiting
+        },
+        "nlp_cache": nlp_parser.cache_stats() if nlp_parser else {}
     }
 
 
@@ -140,12 +175,16 @@ async def upload_file(file: UploadFile = File(...)):
     file_path = config.KNOWLEDGE_BASE_DIR / file.filename
     
     try:
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # Stream to disk so memory stays flat for large workbooks
+        async with aiofiles.open(file_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
             
-        # Add to knowledge base
-        if knowledge_base.add_file(str(file_path)):
+        # Add to knowledge base (parses the workbook, so keep it off the loop)
+        added = await asyncio.to_thread(knowledge_base.add_file, str(file_path))
+        # An upload may replace a cached file under the same name
+        sheet_cache.clear()
+        if added:
             return {"success": True, "message": f"文件 {file.filename} 上传成功"}
         else:
             raise HTTPException(status_code=500, detail="文件处理失败")
@@ -154,6 +193,26 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def get_processed_sheets(file_id: str, processor: ExcelProcessor) -> Dict[str, pd.DataFrame]:
+    """Return a file's processed sheets, reusing them until the file changes on disk"""
+    try:
+        mtime_ns = processor.file_path.stat().st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    
+    cached = sheet_cache.get(file_id)
+    if cached is not None and cached[0] == mtime_ns:
+        sheet_cache.move_to_end(file_id)
+        return cached[1]
+    
+    sheets = await asyncio.to_thread(processor.process_all_sheets)
+    sheet_cache[file_id] = (mtime_ns, sheets)
+    sheet_cache.move_to_end(file_id)
+    while len(sheet_cache) > SHEET_CACHE_SIZE:
+        sheet_cache.popitem(last=False)
+    return sheets
+
+
 @app.post("/api/analyze", response_model=AnalysisResponse)
 async def analyze(request: AnalysisRequest):
     """Analyze data based on natural language query"""
@@ -171,18 +230,27 @@ async def analyze(request: AnalysisRequest):
             message="知识库为空，请先上传Excel文件"
         )
     
+    # Wait for an analysis slot
+    global analyze_waiting, analyze_running
+    analyze_waiting += 1
+    try:
+        await ANALYZE_SEM.acquire()
+    finally:
+        analyze_waiting -= 1
+    analyze_running += 1
+    
     try:
         # Get file context
         file_context = knowledge_base.get_all_summaries()
         
         # Parse query to get analysis intent
-        intent = nlp_parser.parse_query(query, file_context)
+        intent = await asyncio.to_thread(nlp_parser.parse_query, query, file_context)
         
         # Select target file
         file_id = request.file_id
         if not file_id:
-            file_id = nlp_parser.select_target_file(
-                query, intent, knowledge_base.index
+            file_id = await asyncio.to_thread(
+                nlp_parser.select_target_file, query, intent, knowledge_base.index
             )
         
         if not file_id or file_id not in knowledge_base.files:
@@ -193,17 +261,20 @@ async def analyze(request: AnalysisRequest):
         file_info = knowledge_base.index[file_id]
         
         # Process sheets and get DataFrame
-        processed_sheets = processor.process_all_sheets()
+        processed_sheets = await get_processed_sheets(file_id, processor)
         first_sheet = list(processed_sheets.keys())[0]
         df = processed_sheets[first_sheet]
         
         # Generate analysis code
-        code, used_columns = code_generator.generate_code(
-            query, intent, file_info, "df"
+        code, used_columns = await asyncio.to_thread(
+            code_generator.generate_code, query, intent, file_info, "df"
         )
         
         # Execute code
-        exec_result = code_executor.execute(code, df, "df")
+        loop = asyncio.get_running_loop()
+        exec_result = await loop.run_in_executor(
+            code_pool, execute_in_process, code, df, "df"
+        )
         
         # Format result
         formatted = ResultFormatter.format_for_display(exec_result)
@@ -225,6 +296,9 @@ async def analyze(request: AnalysisRequest):
             message=f"分析失败: {str(e)}",
             code=None
         )
+    finally:
+        analyze_running -= 1
+        ANALYZE_SEM.release()
 
 
 @app.delete("/api/files/{file_id}")
@@ -243,6 +317,7 @@ async def delete_file(file_id: str):
         # Remove from knowledge base
         del knowledge_base.files[file_id]
         del knowledge_base.index[file_id]
+        sheet_cache.pop(file_id, None)
         
         return {"success": True, "message": "文件已删除"}
     except Exception as e:
@@ -299,6 +374,13 @@ async def analysis_websocket(websocket: WebSocket):
                 file_id = data.get("file_id")
                 
                 # Send progress updates
+                if ANALYZE_SEM.locked():
+                    await websocket.send_json({
+                        "type": "progress",
+                        "step": "queued",
+                        "message": f"排队中，前面还有 {analyze_waiting} 个分析..."
+                    })
+                
                 await websocket.send_json({
                     "type": "progress",
                     "step": "parsing",
@@ -1310,6 +1392,7 @@ if __name__ == "__main__":
         "app:app",
         host=config.HOST,
         port=config.PORT,
-        reload=True
+        reload=True,
+        loop="uvloop" if uvloop else "asyncio"
     )
 
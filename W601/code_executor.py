@@ -428,6 +428,22 @@ class CodeExecutor:
         return self._simple_executor.execute(code, df, df_name)
 
 
+# Executor owned by the current worker process, created on first use
+_process_executor: Optional[CodeExecutor] = None
+
+
+def execute_in_process(code: str, df: pd.DataFrame, df_name: str = "df") -> Dict[str, Any]:
+    """Process-pool entry point: execute code with this worker's CodeExecutor
+    
+    The simple executor's SIGALRM timeout only works in a process's main thread,
+    so code runs in pool processes rather than in threads.
+    """
+    global _process_executor
+    if _process_executor is None:
+        _process_executor = CodeExecutor()
+    return _process_executor.execute(code, df, df_name)
+
+
 class ResultFormatter:
     """Format execution results for display"""
     
@@ -28,6 +28,9 @@ PORT = int(os.getenv("PORT", 8000))
 # Analysis Settings
 MAX_ROWS_PREVIEW = 1000
 MAX_CODE_EXECUTION_TIME = 30  # seconds
+ANALYZE_CONCURRENCY = int(os.getenv("ANALYZE_CONCURRENCY", 4))  # concurrent analyses
+NLP_CACHE_SIZE = 512  # cached LLM intents / file selections
+NLP_CACHE_TTL = 600  # seconds
 
 # Supported file extensions
 SUPPORTED_EXTENSIONS = [".xlsx", ".xls", ".csv"]
@@ -5,11 +5,60 @@ Also handles Excel structure detection for complex headers
 Based on reference: prompt.py
 """
 import json
-from typing import Dict, List, Any, Optional
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Hashable
 from openai import OpenAI
 import config
 
 
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a fixed time"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+def _normalize_query(query: str) -> str:
+    """Collapse whitespace so trivially different spellings share a cache entry"""
+    return " ".join(query.split())
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
 class AnalysisIntent:
     """Represents parsed analysis intent from user query"""
     
@@ -58,6 +107,10 @@ class NLPParser:
             base_url=config.OPENAI_BASE_URL
         ) if config.OPENAI_API_KEY else None
         
+        # Successful LLM answers, keyed by normalized query and context digest
+        self.intent_cache = TTLCache(config.NLP_CACHE_SIZE, config.NLP_CACHE_TTL)
+        self.file_cache = TTLCache(config.NLP_CACHE_SIZE, config.NLP_CACHE_TTL)
+        
         self.system_prompt = """你是一个专业的数据分析助手。你的任务是理解用户的自然语言问题，并提取分析意图。
 
 请根据用户的问题，返回JSON格式的分析意图，包含以下字段：
@@ -89,6 +142,11 @@ class NLPParser:
         """Parse user query with file context"""
         if not self.client:
             return self._rule_based_parse(query, file_context)
+        
+        cache_key = (_normalize_query(query), _digest(file_context))
+        cached = self.intent_cache.get(cache_key)
+        if cached is not None:
+            return AnalysisIntent(**cached)
             
         user_prompt = f"""知识库中的文件信息：
 {file_context}
@@ -109,7 +167,9 @@ class NLPParser:
             )
             
             result = json.loads(response.choices[0].message.content)
-            return AnalysisIntent(**result)
+            intent = AnalysisIntent(**result)
+            self.intent_cache.put(cache_key, result)
+            return intent
             
         except Exception as e:
             print(f"LLM parsing error: {e}")
@@ -222,6 +282,13 @@ class NLPParser:
         
         return result
     
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters for the intent and file-selection caches"""
+        return {
+            "intent": self.intent_cache.stats(),
+            "file_selection": self.file_cache.stats()
+        }
+    
     def select_target_file(
         self, 
         query: str, 
@@ -236,11 +303,17 @@ class NLPParser:
             return list(file_summaries.keys())[0]
             
         summaries_text = json.dumps(file_summaries, ensure_ascii=False, indent=2)
+        intent_text = json.dumps(intent.to_dict(), ensure_ascii=False)
+        
+        cache_key = (_normalize_query(query), intent_text, _digest(summaries_text))
+        cached = self.file_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         prompt = f"""根据用户的分析需求，从以下文件中选择最合适的文件：
 
 用户问题：{query}
-分析意图：{json.dumps(intent.to_dict(), ensure_ascii=False)}
+分析意图：{intent_text}
 
 可用文件：
 {summaries_text}
@@ -259,7 +332,10 @@ class NLPParser:
             )
             
             result = json.loads(response.choices[0].message.content)
-            return result.get("selected_file_id")
+            file_id = result.get("selected_file_id")
+            if file_id:
+                self.file_cache.put(cache_key, file_id)
+            return file_id
             
         except Exception as e:
             print(f"File selection error: {e}")